@@ -0,0 +1,241 @@
+"""
+Batch Recolor - headless catalogue renders.
+
+Recolors every photo in a folder with every swatch of the chosen
+CATEGORIES and writes one file per (image, swatch) pair:
+
+  python batch_recolor.py IMAGES MASKS OUT -c Bedroom Kitchen
+  python batch_recolor.py IMAGES MASKS OUT -c all -j 8
+  python batch_recolor.py IMAGES MASKS OUT -c Bedroom --scaling
+  python batch_recolor.py IMAGES MASKS OUT -c all --feather guided --mode lab
+
+Masks are single-channel images or project files named after the photo
+(images/room1.jpg -> masks/room1.png or masks/room1.roompaint.json).
+Masks saved at the working resolution are scaled up to the photo with
+nearest-neighbour.
+
+Each photo and mask is decoded once by the parent and dumped to a
+memory-mapped .npy file; workers map it read-only instead of receiving
+a pickled copy per task.
+"""
+
+import argparse
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, wait
+
+import cv2
+import numpy as np
+
+from project_file import PROJECT_EXT, load_project
+from recolor_core import CATEGORIES, FEATHER_MODES, RECOLOR_MODES, RecolorEngine
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp")
+ENGINE_CACHE = 2  # engines kept per worker (one image in flight + the next)
+
+
+# ── Helpers ───────────────────────────────────────────────────
+
+def slug(text):
+    return re.sub(r"[^A-Za-z0-9]+", "_", text).strip("_").lower()
+
+
+def collect_swatches(category_names):
+    if "all" in category_names:
+        category_names = list(CATEGORIES.keys())
+    swatches = []
+    for cat in category_names:
+        if cat not in CATEGORIES:
+            raise SystemExit(f"ERROR: Unknown category '{cat}' "
+                             f"(choose from {', '.join(CATEGORIES)})")
+        for name, bgr in CATEGORIES[cat]:
+            swatches.append((cat, name, bgr))
+    return swatches
+
+
+def find_jobs(images_dir, masks_dir):
+    masks = {}
+    for fn in os.listdir(masks_dir):
+        stem, ext = os.path.splitext(fn)
+        if fn.endswith(PROJECT_EXT):
+            masks[fn[:-len(PROJECT_EXT)]] = os.path.join(masks_dir, fn)
+        elif ext.lower() in IMAGE_EXTS:
+            masks.setdefault(stem, os.path.join(masks_dir, fn))
+
+    jobs = []
+    for fn in sorted(os.listdir(images_dir)):
+        stem, ext = os.path.splitext(fn)
+        if ext.lower() not in IMAGE_EXTS:
+            continue
+        if stem not in masks:
+            print(f"  !! No mask for {fn}, skipped")
+            continue
+        jobs.append((stem, os.path.join(images_dir, fn), masks[stem]))
+    return jobs
+
+
+def load_pair(image_path, mask_path):
+    image = cv2.imread(image_path)
+    if image is None:
+        return None, None
+    h, w = image.shape[:2]
+    if mask_path.endswith(PROJECT_EXT):
+        return image, load_project(mask_path).mask_at(w, h)
+    mask = cv2.imread(mask_path, cv2.IMREAD_GRAYSCALE)
+    if mask is None:
+        return None, None
+    if mask.shape != (h, w):
+        mask = cv2.resize(mask, (w, h), interpolation=cv2.INTER_NEAREST)
+    return image, mask
+
+
+# ── Worker side ───────────────────────────────────────────────
+
+_engines = OrderedDict()
+
+
+def _init_worker():
+    # One process per core already; extra OpenCV threads only contend.
+    cv2.setNumThreads(1)
+
+
+def _get_engine(image_npy, mask_npy, feather="gaussian", mode="hsv"):
+    engine = _engines.get(image_npy)
+    if engine is None:
+        image = np.load(image_npy, mmap_mode="r")
+        mask = np.load(mask_npy, mmap_mode="r")
+        engine = RecolorEngine(image, np.ascontiguousarray(mask), feather=feather, mode=mode)
+        _engines[image_npy] = engine
+        while len(_engines) > ENGINE_CACHE:
+            _engines.popitem(last=False)
+    else:
+        _engines.move_to_end(image_npy)
+    return engine
+
+
+def render_swatches(image_npy, mask_npy, stem, swatches, out_dir, ext, feather="gaussian",
+                    mode="hsv"):
+    engine = _get_engine(image_npy, mask_npy, feather, mode)
+    written = 0
+    for cat, name, bgr in swatches:
+        out = engine.recolor(bgr)
+        path = os.path.join(out_dir, f"{stem}__{slug(cat)}__{slug(name)}{ext}")
+        if cv2.imwrite(path, out):
+            written += 1
+    return written
+
+
+# ── Driver ────────────────────────────────────────────────────
+
+def run_batch(jobs, swatches, out_dir, workers, ext=".jpg", verbose=True, feather="gaussian",
+              mode="hsv"):
+    """Render every (job, swatch) pair; returns (renders, seconds)."""
+    os.makedirs(out_dir, exist_ok=True)
+    shm_root = "/dev/shm" if os.path.isdir("/dev/shm") else None
+    tmp = tempfile.mkdtemp(prefix="roompaint_", dir=shm_root)
+
+    # Split each image's swatches so every worker gets a share of it
+    per_chunk = max(1, -(-len(swatches) // workers))
+    chunks = [swatches[i:i + per_chunk] for i in range(0, len(swatches), per_chunk)]
+
+    # Workers fork from a process that has imported the core already
+    # (where forking isn't the default, preload it into the fork server)
+    multiprocessing.set_forkserver_preload(["recolor_core"])
+    in_flight = []  # (futures, files) per image, oldest first
+    renders = 0
+    t0 = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            for idx, (stem, image_path, mask_path) in enumerate(jobs):
+                # Keep only a couple of images per worker resident at once
+                while len(in_flight) >= workers * 2:
+                    renders += _retire(in_flight.pop(0))
+
+                image, mask = load_pair(image_path, mask_path)
+                if image is None:
+                    print(f"  !! Could not load {image_path}")
+                    continue
+                image_npy = os.path.join(tmp, f"{idx}_image.npy")
+                mask_npy = os.path.join(tmp, f"{idx}_mask.npy")
+                np.save(image_npy, image)
+                np.save(mask_npy, mask)
+                del image, mask
+
+                futures = [pool.submit(render_swatches, image_npy, mask_npy, stem,
+                                       chunk, out_dir, ext, feather, mode) for chunk in chunks]
+                in_flight.append((futures, (image_npy, mask_npy)))
+                if verbose:
+                    print(f"  [{idx + 1}/{len(jobs)}] {stem}")
+
+            while in_flight:
+                renders += _retire(in_flight.pop(0))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return renders, time.perf_counter() - t0
+
+
+def _retire(entry):
+    futures, files = entry
+    wait(futures)
+    for f in files:
+        os.remove(f)  # workers keep their mapping until evicted
+    return sum(f.result() for f in futures)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Recolor a folder of rooms across palette categories.")
+    ap.add_argument("images", help="folder of room photos")
+    ap.add_argument("masks", help="folder of wall masks named after the photos")
+    ap.add_argument("out", help="output folder")
+    ap.add_argument("-c", "--categories", nargs="+", default=["all"],
+                    help="CATEGORIES names, or 'all'")
+    ap.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--ext", default=".jpg", help="output extension (.jpg, .png, .webp)")
+    ap.add_argument("--feather", choices=FEATHER_MODES, default="gaussian",
+                    help="wall edge blend; 'guided' follows the photo's edges")
+    ap.add_argument("--mode", choices=RECOLOR_MODES, default="hsv",
+                    help="recolor model; 'lab' keeps the wall's shading")
+    ap.add_argument("--scaling", action="store_true",
+                    help="rerun with 1, 2, 4 ... workers and report speedup")
+    args = ap.parse_args()
+
+    jobs = find_jobs(args.images, args.masks)
+    swatches = collect_swatches(args.categories)
+    if not jobs or not swatches:
+        print("ERROR: Nothing to do")
+        return
+
+    print("==================================================")
+    print(f"  {len(jobs)} images x {len(swatches)} swatches, {args.workers} workers")
+    print("==================================================")
+
+    if not args.scaling:
+        renders, secs = run_batch(jobs, swatches, args.out, args.workers, args.ext,
+                                  feather=args.feather, mode=args.mode)
+        print(f"  >> {renders} renders in {secs:.2f}s = {renders / secs:.1f} images/sec")
+        return
+
+    counts = []
+    n = 1
+    while n < args.workers:
+        counts.append(n)
+        n *= 2
+    counts.append(args.workers)
+
+    base = None
+    print(f"  {'workers':>8} {'images/sec':>11} {'speedup':>8} {'efficiency':>11}")
+    for n in counts:
+        renders, secs = run_batch(jobs, swatches, args.out, n, args.ext, verbose=False,
+                                  feather=args.feather, mode=args.mode)
+        rate = renders / secs
+        base = base or rate
+        print(f"  {n:>8} {rate:>11.1f} {rate / base:>7.2f}x {rate / base / n:>10.0%}")
+
+
+if __name__ == "__main__":
+    main()
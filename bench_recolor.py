@@ -0,0 +1,426 @@
+"""
+Benchmarks for the recolor, overlay and frame-compose hot paths.
+
+Runs headless on synthetic rooms so results are reproducible:
+
+  python bench_recolor.py                              # full grid -> bench_results.json
+  python bench_recolor.py --sizes 0.5 2 --coverage 0.5 -o quick.json
+  python bench_recolor.py --baseline bench_results.json   # fail on regressions
+  python bench_recolor.py --startup                    # import / first-recolor check only
+
+Every case records the median and best wall time over --repeat runs
+and the peak memory allocated during one run (tracemalloc; NumPy and
+OpenCV outputs are both tracked).
+
+Startup cases run in fresh interpreters and time `import` of the core
+module and of the GUI, and import-to-first-recolor; startup/worker is
+the same first recolor in a pool worker started from this (already
+imported) process, which is what batch_recolor.py pays per worker. The
+run fails if importing the core pulls in a GUI toolkit.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from color_changer import (COMPARE_SCALE, MAX_W, PIXEL_ZOOM_MAX, EditHistory, FrameRenderer,
+                           GalleryCache, ViewPyramid, draw_palette, labels_op, list_op,
+                           palette_pages)
+from paint_catalog import load_catalog, parse_catalog
+from recolor_core import (CATEGORIES, CATEGORY_NAMES, LayerCompositor, RecolorEngine,
+                          SeedSegmenter, feather_alpha, overlay_mask, recolor_walls,
+                          wall_lightness)
+
+SIZES_MP = (0.5, 2, 12, 48)
+COVERAGE = (0.1, 0.5, 0.9)
+ZOOMS = (1.0, 2.5, 5.0)
+TARGET_BGR = (142, 188, 159)
+N_LAYERS = 10
+HISTORY_EDITS = 200
+GALLERY_TILES = 9  # Compare gallery: Original + 7 snapshots + the live panel
+CATALOG_PAINTS = 10000
+ASPECT = 4 / 3
+STARTUP_MODULES = {"core": "recolor_core", "gui": "color_changer"}
+GUI_MODULES = ("tkinter",)  # Must never be imported by the core
+
+# Runs in a fresh interpreter: {module} is imported, then one small recolor
+STARTUP_PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import {module} as m
+t1 = time.perf_counter()
+import numpy as np
+image = np.full((480, 640, 3), 128, np.uint8)
+mask = np.zeros((480, 640), np.uint8)
+mask[60:420, 80:560] = 255
+m.RecolorEngine(image, mask).recolor({target})
+t2 = time.perf_counter()
+print(json.dumps({{"import_ms": (t1 - t0) * 1000, "first_recolor_ms": (t2 - t0) * 1000,
+                  "gui": [g for g in {gui!r} if g in sys.modules]}}))
+"""
+
+
+# ── Synthetic inputs ──────────────────────────────────────────
+
+def synthetic_room(megapixels, seed=0):
+    """Smooth shaded 'room' with some texture, deterministic for a seed."""
+    w = int(round((megapixels * 1e6 * ASPECT) ** 0.5))
+    h = int(round(w / ASPECT))
+    rng = np.random.default_rng(seed)
+    small = rng.integers(40, 220, (6, 8, 3), dtype=np.uint8)
+    image = cv2.resize(small, (w, h), interpolation=cv2.INTER_CUBIC)
+    noise = rng.integers(0, 16, (h // 4 + 1, w // 4 + 1, 1), dtype=np.uint8)
+    image = cv2.add(image, cv2.resize(np.repeat(noise, 3, axis=2), (w, h)))
+    return image
+
+
+def synthetic_quad(shape, coverage):
+    """Centered slanted quad covering roughly `coverage` of the image."""
+    h, w = shape[:2]
+    s = coverage ** 0.5
+    cx, cy, hw, hh = w / 2, h / 2, w * s / 2, h * s / 2
+    lean = 0.04 * w * s
+    return np.array([[cx - hw + lean, cy - hh], [cx + hw, cy - hh],
+                     [cx + hw - lean, cy + hh], [cx - hw, cy + hh]], np.int32)
+
+
+def synthetic_mask(shape, coverage):
+    mask = np.zeros(shape[:2], np.uint8)
+    cv2.fillPoly(mask, [synthetic_quad(shape, coverage)], 255)
+    return mask
+
+
+def split_layers(mask, n=N_LAYERS):
+    """Label map cutting the mask into n vertical strips (adjacent walls)."""
+    x, _, bw, _ = cv2.boundingRect(mask)
+    cols = np.clip(np.arange(mask.shape[1]) - x, 0, bw - 1)
+    strips = (cols * n // bw + 1).astype(np.uint8)
+    return np.where(mask > 0, strips[None, :], 0).astype(np.uint8)
+
+
+def edit_session(shape, edits=HISTORY_EDITS, seed=0):
+    """Selection state and history after `edits` random shapes, recorded like main()."""
+    h, w = shape[:2]
+    rng = np.random.default_rng(seed)
+    S = {"labels": np.zeros((h, w), np.uint8), "mask": np.zeros((h, w), np.uint8),
+         "closed_polys": [], "poly_layers": []}
+    history = EditHistory()
+    for i in range(edits):
+        pts = cv2.convexHull((rng.random((8, 2)) * [w / 2, h / 2] + rng.random(2) * [w / 2, h / 2])
+                             .astype(np.int32)).reshape(-1, 2)
+        x, y, bw, bh = cv2.boundingRect(pts)
+        before = S["labels"][y:y+bh, x:x+bw].copy()
+        cv2.fillPoly(S["mask"], [pts], 255)
+        cv2.fillPoly(S["labels"], [pts], i % 255 + 1)
+        history.push("Close shape", [labels_op(S["labels"], before, (x, y, x + bw, y + bh)),
+                                     list_op(S, "closed_polys", i, [pts.tolist()]),
+                                     list_op(S, "poly_layers", i, [i % 255 + 1])])
+    return S, history
+
+
+def synthetic_catalog(path, n=CATALOG_PAINTS, seed=0):
+    """CSV catalog of n random paints in one category."""
+    rgb = np.random.default_rng(seed).integers(0, 256, (n, 3))
+    with open(path, "w") as f:
+        f.write("name,category,hex\n")
+        f.writelines(f"Paint {i},Bench,#{r:02X}{g:02X}{b:02X}\n" for i, (r, g, b) in enumerate(rgb))
+    return path
+
+
+def base_state(mask, recolored, polys=(), version=0):
+    """The subset of main()'s state dict that FrameRenderer reads.
+
+    polys are the selection in photo coordinates, for zoomed-in views.
+    """
+    return {
+        "mask": mask, "current_poly": [], "phase": "RECOLOR", "overlay": False,
+        "labels": (mask > 0).view(np.uint8), "poly_layers": [1] * len(polys), "layer": 1,
+        "closed_polys": list(polys), "cut_polys": [], "sel_version": version, "feather": "gaussian",
+        "recolor_mode": "hsv", "lab_refs": None,
+        "layer_colors": {1: ("Bench", TARGET_BGR)}, "auto_fill": False,
+        "recolored": recolored, "final_mask": mask, "cat_idx": 0, "page": 0, "ui_map": None,
+        "show_thumbs": False, "compare_mode": False, "snapshots": [],
+        "zoom_level": 1.0, "offset_x": 0, "offset_y": 0,
+    }
+
+
+# ── Measurement ───────────────────────────────────────────────
+
+def measure(fn, repeat):
+    fn()  # warm-up (first-call allocations, lazy init)
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t0) * 1000)
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    times.sort()
+    return {"ms": times[len(times) // 2], "best_ms": times[0], "peak_mb": peak / 2**20}
+
+
+def compose_case(renderer, S, zoom, compare, layers=()):
+    """Full re-compose, or with layers=("view",) just what a pan/zoom redoes."""
+    S["compare_mode"] = compare
+    S["zoom_level"] = zoom
+    renderer.invalidate()
+    renderer.render(S)
+
+    def run():
+        S["offset_x"] = 1 - S["offset_x"]  # Nudge the view like a pan
+        renderer.invalidate(*layers)
+        renderer.render(S)
+    return run
+
+
+def run_suite(sizes, coverages, repeat, log=print):
+    results = {}
+
+    def record(key, fn):
+        results[key] = r = measure(fn, repeat)
+        log(f"  {key:<44} {r['ms']:>9.2f} ms  {r['peak_mb']:>8.1f} MB")
+
+    for mp in sizes:
+        image = synthetic_room(mp)
+        h, w = image.shape[:2]
+        log(f"-- {mp} MP ({w}x{h})")
+        # The window works on a copy shrunk to MAX_W, like main()
+        scale = min(1.0, MAX_W / w)
+        working = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        pyramid = ViewPyramid(image, scale)
+        # Zoomed in as far as main() allows: PIXEL_ZOOM_MAX screen pixels per photo pixel
+        zooms = ZOOMS + (round(PIXEL_ZOOM_MAX / scale, 1),)
+        segmenter = SeedSegmenter(image)
+        record(f"seed_fill/{mp}mp", lambda seg=segmenter: seg.region(w // 2, h // 2))
+        del segmenter
+
+        # Undo + redo of one edit, with HISTORY_EDITS shapes on the working image
+        hist_S, history = edit_session(working.shape)
+        record(f"history_undo_redo/{mp}mp/n{HISTORY_EDITS}",
+               lambda hist=history, st=hist_S: (hist.undo(st), hist.redo(st)))
+        results[f"history_undo_redo/{mp}mp/n{HISTORY_EDITS}"]["history_mb"] = history.nbytes / 2**20
+        log(f"  {'history size':<44} {history.nbytes / 2**20:>12.2f} MB")
+        del hist_S, history
+
+        for cov in coverages:
+            mask = synthetic_mask(image.shape, cov)
+            tag = f"{mp}mp/{int(cov * 100)}%"
+            record(f"recolor_walls/{tag}", lambda image=image: recolor_walls(image, mask, TARGET_BGR))
+            record(f"engine_init/{tag}", lambda image=image: RecolorEngine(image, mask))
+            engine = RecolorEngine(image, mask)
+            record(f"engine_recolor/{tag}", lambda engine=engine: engine.recolor(TARGET_BGR))
+            # Edge-aware feather: the guided filter runs only along the mask edge
+            record(f"feather_guided/{tag}", lambda image=image: feather_alpha(image, mask, "guided"))
+            record(f"engine_init_guided/{tag}", lambda image=image: RecolorEngine(image, mask, feather="guided"))
+            # LAB mode: a new color is a new 256-entry table, then the same lookups
+            lab = RecolorEngine(image, mask, mode="lab")
+            record(f"engine_init_lab/{tag}", lambda image=image: RecolorEngine(image, mask, mode="lab"))
+            record(f"engine_recolor_lab/{tag}", lambda lab=lab: lab.recolor(TARGET_BGR))
+            del lab
+            record(f"overlay_mask/{tag}", lambda image=image: overlay_mask(image, mask))
+            del engine
+
+            wmask = cv2.resize(mask, (working.shape[1], working.shape[0]),
+                               interpolation=cv2.INTER_NEAREST)
+            # N walls, N colors: the first paint, then repainting one wall
+            swatches = [bgr for c in CATEGORIES.values() for _, bgr in c]
+            colors = {k: swatches[k] for k in range(1, N_LAYERS + 1)}
+            layers = LayerCompositor(working, split_layers(wmask))
+            one = min(layers.engines)
+
+            def paint_all():
+                layers.colors = {}
+                layers.update(colors)
+
+            def repaint_one():
+                bgr = TARGET_BGR if layers.colors[one] != TARGET_BGR else colors[one]
+                layers.update({**colors, one: bgr})
+            record(f"layers_paint_all/{tag}/n{N_LAYERS}", paint_all)
+            record(f"layers_repaint_one/{tag}/n{N_LAYERS}", repaint_one)
+
+            S = base_state(wmask, RecolorEngine(working, wmask).recolor(TARGET_BGR),
+                           [synthetic_quad(image.shape, cov).tolist()], cov)
+            ww, wh = working.shape[1], working.shape[0]
+            gallery = GalleryCache(working, layers.render)
+            renderer = FrameRenderer(working, int(ww * COMPARE_SCALE), int(wh * COMPARE_SCALE),
+                                     gallery, pyramid)
+            snapshots = [(f"s{k}", {**colors, one: swatches[k]}) for k in range(GALLERY_TILES - 2)]
+            # compare is the classic 2-up; gallery the full grid of snapshots
+            for mode, n_snapshots in (("normal", None), ("compare", 0),
+                                      ("gallery", GALLERY_TILES - 2)):
+                compare = n_snapshots is not None
+                S["snapshots"] = snapshots[:n_snapshots or 0]
+                for zoom in zooms if mode == "normal" else ZOOMS:
+                    record(f"compose_{mode}/{tag}/z{zoom}", compose_case(renderer, S, zoom, compare))
+                    record(f"pan_{mode}/{tag}/z{zoom}",
+                           compose_case(renderer, S, zoom, compare, ("view",)))
+
+            def gallery_cold():
+                gallery.clear()
+                renderer.invalidate()
+                renderer.render(S)
+            S["zoom_level"] = 1.0
+            record(f"gallery_cold/{tag}/n{GALLERY_TILES}", gallery_cold)
+
+            # First frame at a new zoom: the pyramid rasterizes and recolors the visible tiles
+            S["compare_mode"], S["snapshots"] = False, []
+            for zoom in zooms[1:]:
+                def zoom_cold(pyramid=pyramid):
+                    pyramid.clear()
+                    renderer.invalidate("view")
+                    renderer.render(S)
+                S["zoom_level"] = zoom
+                record(f"zoom_cold/{tag}/z{zoom}", zoom_cold)
+
+            # The same in the LAB mode, plus a pan over its cached tiles
+            S["recolor_mode"], S["sel_version"] = "lab", ("lab", cov)
+            S["lab_refs"] = wall_lightness(working, S["labels"])
+            for zoom in zooms[1:]:
+                S["zoom_level"] = zoom
+                record(f"zoom_cold_lab/{tag}/z{zoom}", zoom_cold)
+                record(f"pan_lab/{tag}/z{zoom}", compose_case(renderer, S, zoom, False, ("view",)))
+            S["recolor_mode"], S["sel_version"], S["lab_refs"] = "hsv", cov, None
+        del image, pyramid
+
+    for width in (900, 1800):
+        record(f"draw_palette/w{width}",
+               lambda: [draw_palette(width, i) for i in range(len(CATEGORY_NAMES))])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = synthetic_catalog(os.path.join(tmp, "bench.csv"))
+        record(f"catalog_parse/n{CATALOG_PAINTS}", lambda: parse_catalog(path))
+        load_catalog(path)  # Writes the index
+        record(f"catalog_load_cached/n{CATALOG_PAINTS}", lambda: load_catalog(path))
+        catalog = load_catalog(path)
+        record(f"catalog_nearest/n{CATALOG_PAINTS}", lambda: catalog.nearest(TARGET_BGR))
+        # One page of a category with every paint in it
+        CATEGORIES["Bench"] = catalog.groups()["Bench"]
+        CATEGORY_NAMES.append("Bench")
+        try:
+            last = palette_pages("Bench", 900) - 1
+            record(f"draw_palette_page/w900/n{CATALOG_PAINTS}",
+                   lambda: draw_palette(900, len(CATEGORY_NAMES) - 1, page=last))
+        finally:
+            del CATEGORIES["Bench"]
+            CATEGORY_NAMES.pop()
+    return results
+
+
+def first_recolor():
+    """The probe's recolor, run inside a pool worker."""
+    image = np.full((480, 640, 3), 128, np.uint8)
+    mask = np.zeros((480, 640), np.uint8)
+    mask[60:420, 80:560] = 255
+    RecolorEngine(image, mask).recolor(TARGET_BGR)
+
+
+def probe_worker():
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        pool.submit(first_recolor).result()
+        return {"first_recolor_ms": (time.perf_counter() - t0) * 1000}
+
+
+def probe_startup(module):
+    code = STARTUP_PROBE.format(module=module, gui=GUI_MODULES, target=TARGET_BGR)
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                         cwd=os.path.dirname(os.path.abspath(__file__)))
+    return json.loads(out.stdout)
+
+
+def run_startup(repeat, log=print):
+    """Startup cases (median of fresh processes); returns (results, failures)."""
+    results, failures = {}, []
+    probes = [(name, lambda m=module: probe_startup(m)) for name, module in STARTUP_MODULES.items()]
+    for name, probe in probes + [("worker", probe_worker)]:
+        probe()  # warm-up (bytecode cache, OS file cache)
+        runs = [probe() for _ in range(repeat)]
+        for metric in ("import_ms", "first_recolor_ms"):
+            if metric not in runs[0]:
+                continue
+            times = sorted(r[metric] for r in runs)
+            key = f"startup/{name}/{metric[:-3]}"
+            results[key] = {"ms": times[len(times) // 2], "best_ms": times[0], "peak_mb": 0.0}
+            log(f"  {key:<44} {results[key]['ms']:>9.2f} ms")
+        if name == "core" and runs[0]["gui"]:
+            failures.append(f"importing {STARTUP_MODULES[name]} pulls in {', '.join(runs[0]['gui'])}")
+    return results, failures
+
+
+def compare_runs(results, baseline, tolerance, min_ms):
+    """Cases slower than baseline by more than tolerance (and min_ms)."""
+    regressions = []
+    for key, r in results.items():
+        b = baseline.get(key)
+        if b is None:
+            continue
+        if r["ms"] > b["ms"] * (1 + tolerance) and r["ms"] - b["ms"] > min_ms:
+            regressions.append((key, b["ms"], r["ms"]))
+    return regressions
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark recolor/overlay/compose hot paths.")
+    ap.add_argument("--sizes", type=float, nargs="+", default=list(SIZES_MP), help="megapixels")
+    ap.add_argument("--coverage", type=float, nargs="+", default=list(COVERAGE),
+                    help="mask coverage fractions")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("-o", "--output", default="bench_results.json")
+    ap.add_argument("--baseline", help="JSON from an earlier run to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.15,
+                    help="allowed slowdown vs baseline (0.15 = 15%%)")
+    ap.add_argument("--min-ms", type=float, default=0.5,
+                    help="ignore slowdowns smaller than this many ms")
+    ap.add_argument("--startup", action="store_true",
+                    help="only the startup cases (import time, import-to-first-recolor)")
+    args = ap.parse_args()
+
+    results = {} if args.startup else run_suite(args.sizes, args.coverage, args.repeat)
+    print("-- startup (fresh interpreters)")
+    startup, failures = run_startup(args.repeat)
+    results.update(startup)
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+            "machine": platform.machine(),
+            "cv2_threads": cv2.getNumThreads(),
+            "repeat": args.repeat,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=1)
+    print(f"  >> Wrote {args.output}")
+    for failure in failures:
+        print(f"  !! STARTUP {failure}")
+    if failures:
+        sys.exit(1)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare_runs(results, baseline, args.tolerance, args.min_ms)
+        for key, old, new in regressions:
+            print(f"  !! REGRESSION {key}: {old:.2f} -> {new:.2f} ms ({new / old - 1:+.0%})")
+        if regressions:
+            sys.exit(1)
+        print(f"  >> No regressions vs {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,121 +7,93 @@ PHASE 1 - SELECT:
   • ENTER / Mid-Click: Close Shape.
   • MOUSE WHEEL: Zoom In/Out (centered at mouse cursor).
   • HOLD LEFT CLICK + DRAG: Pan (while zoomed in).
+  • A: Toggle Auto Fill (Left Click: Add Wall Region, Right Click: Cut Region).
   • SPACE: Finish Selection.
 
 PHASE 2 - RECOLOR & COMPARE:
+  • Every closed shape / filled region is a layer with its own color.
+  • Left Click on a Wall: Make its Layer Active (the palette paints it).
+  • Right Click on a Wall: List the Closest Catalog Paints to its color
+       (Custom... does the same for the picked color).
+  • < / >: Page through the Palette, then the Categories.
   • C: Toggle Compare Mode.
-  • V: Snapshot -> Left Panel.
-  • O: Reset Left Panel.
-  • S: Save.
-  • MOUSE WHEEL: Zoom In/Out.
+  • V: Add a Snapshot of the current colors to the Compare Gallery.
+  • O: Clear the Gallery.
+  • T: Toggle Room Previews in the Palette.
+  • E: Toggle Edge-Aware Feathering (the paint edge follows the photo's edges).
+  • L: Toggle LAB Recolor (keeps the wall's shading; better whites and darks).
+
+ANY PHASE:
+  • F: Toggle Performance HUD (stage p50/p95, FPS); a Chrome trace is
+       written when it is turned off. ROOMPAINT_PROFILE=1 starts with it on.
+  • Z / Y: Undo / Redo (points, shapes, auto fills, colors, snapshots).
+  • S: Save (full resolution).
+  • P: Save Project (walls + color; reopen with `color_changer.py x.roompaint.json`).
+  • MOUSE WHEEL: Zoom In/Out; deep zoom shows the photo at full resolution.
   • HOLD LEFT CLICK + DRAG: Pan.
 """
 
 import cv2
 import numpy as np
+import contextlib
+import json
 import os
-import tkinter as tk
-from tkinter import colorchooser
+import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from paint_catalog import PaintCatalog, load_catalog
+from project_file import PROJECT_EXT, load_project, project_path_for, save_project
+# The GUI-free core; re-exported so existing `from color_changer import ...` keeps working
+from recolor_core import (CATEGORIES, CATEGORY_NAMES, EXPORT_TILE, FEATHER_KSIZE, FEATHER_MODES,
+                          IMAGE_PATH, RECOLOR_MODES, SEED_COARSE_MAX, SEED_LIMIT, SEED_TOLERANCE,
+                          LayerCompositor, RecolorEngine, SeedSegmenter, export_full_resolution,
+                          feather_alpha, feather_radius, fill_selection, lab_lut, lightness,
+                          mask_to_polys, overlay_mask, recolor_tiled, recolor_walls, scale_polys,
+                          wall_lightness)
+
+# The compatibility re-exports above; also all that `from color_changer import *` gives
+__all__ = [
+    "CATEGORIES", "CATEGORY_NAMES", "EXPORT_TILE", "FEATHER_KSIZE", "FEATHER_MODES",
+    "IMAGE_PATH", "RECOLOR_MODES", "SEED_COARSE_MAX", "SEED_LIMIT", "SEED_TOLERANCE",
+    "LayerCompositor", "RecolorEngine", "SeedSegmenter", "export_full_resolution",
+    "feather_alpha", "feather_radius", "fill_selection", "lab_lut", "lightness",
+    "mask_to_polys", "overlay_mask", "recolor_tiled", "recolor_walls", "scale_polys",
+    "wall_lightness",
+]
 
 # ── Config ────────────────────────────────────────────────────
-IMAGE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
-                          "bedroom image.jpeg")
-
-CATEGORIES = {
-    "Bedroom": [
-        ("Light Blue", (230, 216, 173)),
-        # ... (Same colors as before, kept short for brevity in file but will include all)
-        ("Slate Blue", (205, 90, 106)),
-        ("Navy Blue", (128, 0, 0)),
-        ("Sage Green", (142, 188, 159)),
-        ("Silver", (192, 192, 192)),
-        ("Lavender", (230, 230, 250)),
-        ("Warm Gray", (169, 169, 169)),
-        ("Charcoal", (54, 54, 54)),
-        ("Crisp White", (255, 255, 255)),
-        ("Terracotta", (94, 114, 226)),
-        ("Rust", (67, 75, 183)),
-        ("Cream", (220, 245, 255))
-    ],
-    "Kitchen": [
-        ("White", (255, 255, 255)),
-        ("Warm Yellow", (153, 228, 255)),
-        ("Red Accent", (50, 50, 220)),
-        ("Orange Accent", (0, 165, 255))
-    ],
-    "Hall/Living": [
-        ("Warm Beige", (200, 228, 245)),
-        ("Greige", (180, 180, 170)),
-        ("Soft Terracotta", (120, 140, 210)),
-        ("Earthy Ochre", (80, 160, 204)),
-        ("Green", (80, 180, 80)),
-        ("Charcoal Acc", (60, 60, 60))
-    ],
-    "Bathroom": [
-        ("Crisp White", (250, 250, 250)),
-        ("Aqua", (255, 255, 0)),
-        ("Light Teal", (180, 180, 100)),
-        ("Charcoal", (70, 70, 70)),
-        ("Black Accent", (10, 10, 10))
-    ],
-    "Dining": [
-        ("Warm Red", (60, 60, 200)),
-        ("Aubergine", (80, 40, 70))
-    ],
-    "Office": [
-        ("Green", (100, 180, 100)),
-        ("Deep Blue", (150, 50, 10)),
-        ("Yellow Acc", (50, 220, 240))
-    ],
-    "Gaming": [
-        ("Neutral Gray", (150, 150, 150)),
-        ("Matte Black", (25, 25, 25)),
-        ("White", (245, 245, 245))
-    ]
-}
-
-CATEGORY_NAMES = list(CATEGORIES.keys())
 PALETTE_HEIGHT = 100
+SWATCH_MIN_W = 72  # Narrowest swatch; longer categories are split into pages
 MAX_W = 900 
 COMPARE_SCALE = 0.8 
 
 # ── Helpers ───────────────────────────────────────────────────
 
-def recolor_walls(original_bgr, mask, target_bgr):
-    hsv = cv2.cvtColor(original_bgr, cv2.COLOR_BGR2HSV).copy()
-    t = np.uint8([[list(target_bgr)]])
-    t_hsv = cv2.cvtColor(t, cv2.COLOR_BGR2HSV)[0][0]
-
-    wall = mask > 0
-    hsv[wall, 0] = t_hsv[0]
-    hsv[wall, 1] = t_hsv[1]
+def swatches_per_page(canvas_width):
+    return max(1, canvas_width // SWATCH_MIN_W)
 
-    if t_hsv[1] < 20: 
-        v_blend = hsv[wall, 2].astype(np.float32) * 0.3 + t_hsv[2] * 0.7
-        hsv[wall, 2] = np.clip(v_blend, 0, 255).astype(np.uint8)
 
-    recolored = cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
+def palette_pages(cat_name, canvas_width):
+    return max(1, -(-len(CATEGORIES[cat_name]) // swatches_per_page(canvas_width)))
 
-    alpha = cv2.GaussianBlur(mask, (7, 7), 0).astype(np.float32) / 255.0
-    alpha_3 = np.dstack([alpha, alpha, alpha])
-    result = (alpha_3 * recolored.astype(np.float32) +
-              (1 - alpha_3) * original_bgr.astype(np.float32)).astype(np.uint8)
-    return result
 
+def palette_page(cat_name, page, canvas_width):
+    """The (name, bgr) swatches on one page of a category."""
+    per = swatches_per_page(canvas_width)
+    return CATEGORIES[cat_name][page * per:(page + 1) * per]
 
-def overlay_mask(image, mask, color=(0, 255, 0), opacity=0.35):
-    out = image.copy()
-    m = mask > 0
-    out[m] = ((1 - opacity) * out[m] + opacity * np.array(color)).astype(np.uint8)
-    return out
 
-
-def draw_palette(canvas_width, category_idx):
+def draw_palette(canvas_width, category_idx, thumbs=None, page=0):
     bar = np.zeros((PALETTE_HEIGHT, canvas_width, 3), dtype=np.uint8)
     bar[:] = (40, 40, 40)
 
     cat_name = CATEGORY_NAMES[category_idx]
+    pages = palette_pages(cat_name, canvas_width)
+    page = min(page, pages - 1)  # The canvas may have widened since
     
     cv2.rectangle(bar, (10, 5), (60, 35), (70, 70, 70), -1)
     cv2.putText(bar, "<", (25, 28), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (200, 200, 200), 2)
@@ -130,6 +102,8 @@ def draw_palette(canvas_width, category_idx):
     cv2.putText(bar, ">", (canvas_width - 45, 28), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (200, 200, 200), 2)
 
     label = f"Category: {cat_name}"
+    if pages > 1:
+        label += f"  {page + 1}/{pages}"
     tw = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.7, 2)[0][0]
     cv2.putText(bar, label, ((canvas_width - tw)//2, 28), 
                 cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
@@ -140,16 +114,21 @@ def draw_palette(canvas_width, category_idx):
     cv2.putText(bar, "Custom...", (custom_btn_x1 + 10, 26), 
                 cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
 
-    colors = CATEGORIES[cat_name]
+    # Only this page is drawn, however long the category is
+    colors = palette_page(cat_name, page, canvas_width)
     rects = []
     if colors:
-        cols = len(colors)
+        cols = len(colors) if pages == 1 else swatches_per_page(canvas_width)
         sw = canvas_width // cols
         for i, (name, bgr) in enumerate(colors):
             x1, x2 = i * sw, (i + 1) * sw
             y1, y2 = 45, PALETTE_HEIGHT - 5
             
             cv2.rectangle(bar, (x1+2, y1), (x2-2, y2), bgr, -1)
+            if thumbs is not None:
+                # Room preview above a strip of the flat color
+                cell = bar[y1:y2 - 14, x1+2:x2-2]
+                cell[:] = fit_thumbnail(thumbs[i], cell.shape[1], cell.shape[0])
             cv2.rectangle(bar, (x1+2, y1), (x2-2, y2), (200,200,200), 1)
             
             fs = 0.4
@@ -171,12 +150,29 @@ def draw_palette(canvas_width, category_idx):
         'prev': (10, 5, 60, 35),
         'next': (canvas_width - 60, 5, canvas_width - 10, 35),
         'custom': (custom_btn_x1, 5, custom_btn_x2, 35),
-        'swatches': rects
+        'swatches': rects,
+        'page': page,
+        'pages': pages
     }
     return bar, ui_map
 
 
+def fit_thumbnail(thumb, width, height):
+    """Center-crop thumb to the cell's aspect ratio and scale it to (width, height)."""
+    th, tw = thumb.shape[:2]
+    if tw * height > th * width:
+        cw = max(1, th * width // height)
+        thumb = thumb[:, (tw - cw) // 2:(tw - cw) // 2 + cw]
+    else:
+        ch = max(1, tw * height // width)
+        thumb = thumb[(th - ch) // 2:(th - ch) // 2 + ch]
+    return cv2.resize(thumb, (width, height), interpolation=cv2.INTER_AREA)
+
+
 def pick_custom_color():
+    # Tk is only needed for this dialog; importing it costs startup time
+    import tkinter as tk
+    from tkinter import colorchooser
     root = tk.Tk()
     root.withdraw()
     color = colorchooser.askcolor(title="Choose Wall Color")
@@ -192,44 +188,972 @@ def put_text(img, text, pos, scale=0.55, col=(255,255,255)):
     cv2.putText(img, text, pos, cv2.FONT_HERSHEY_SIMPLEX, scale, col,     1, cv2.LINE_AA)
 
 
+# ── Paint catalogs ────────────────────────────────────────────
+
+CATALOG_ENV = "ROOMPAINT_CATALOGS"  # Catalog files (CSV/JSON), separated by os.pathsep
+CLOSEST_CATEGORY = "Closest Paints"  # Palette category filled by a nearest-paint search
+
+
+def load_catalogs(paths):
+    """Add the categories of catalog files to the palette; returns the search index.
+
+    The index covers the built-in swatches and every loaded paint, so a
+    nearest-paint search looks at all of them.
+    """
+    catalogs = [PaintCatalog.from_categories(CATEGORIES)]
+    for path in paths:
+        t0 = time.perf_counter()
+        try:
+            catalog = load_catalog(path)
+        except (OSError, ValueError) as e:
+            print(f"  !! Catalog {path}: {e}")
+            continue
+        for cat_name, colors in catalog.groups().items():
+            CATEGORIES.setdefault(cat_name, []).extend(colors)
+        catalogs.append(catalog)
+        print(f"  >> Catalog {os.path.basename(path)}: {len(catalog)} paints "
+              f"in {(time.perf_counter() - t0) * 1000:.0f} ms")
+    CATEGORY_NAMES[:] = list(CATEGORIES)
+    return PaintCatalog.concat(catalogs)
+
+
+# ── Background recolor ────────────────────────────────────────
+
+PREVIEW_SCALE = 0.25  # Resolution of the quick preview shown before the full result
+
+
+class RecolorWorker:
+    """One background thread that recolors the most recently requested layer colors.
+
+    submit() replaces whatever is still pending, so superseded clicks are
+    dropped instead of queued. Each request first produces a low-res
+    preview, then the full result; poll() hands finished images to the UI
+    thread, which never waits on a recolor. The compositors for a new
+    image are built on this thread too, ahead of the first request.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._layers = None
+        self._source = None  # set_image() arguments not built into compositors yet
+        self._pending = None
+        self._results = deque()
+        self._gen = 0
+        self._stopped = False
+        self.prof = FrameProfiler()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def set_image(self, original, labels, feather="gaussian", mode="hsv", lab_refs=None):
+        """Start building the full and preview compositors for a new (image, label map).
+
+        Returns at once; requests submitted meanwhile run once they are built.
+        """
+        with self._cond:
+            # The label map is edited in place by the UI thread; build from a copy
+            self._source = (original, labels.copy(), feather, mode, lab_refs)
+            self._layers = None
+            self._gen += 1
+            self._pending = None
+            self._results.clear()
+            self._cond.notify_all()
+
+    @staticmethod
+    def _build(original, labels, feather, mode, lab_refs):
+        h, w = labels.shape[:2]
+        pw, ph = max(1, int(w * PREVIEW_SCALE)), max(1, int(h * PREVIEW_SCALE))
+        small = cv2.resize(original, (pw, ph), interpolation=cv2.INTER_AREA)
+        small_labels = cv2.resize(labels, (pw, ph), interpolation=cv2.INTER_NEAREST)
+        # The preview shares the full image's lab_refs, so both map lightness alike
+        return (LayerCompositor(original, labels, feather, None, mode, lab_refs),
+                LayerCompositor(small, small_labels, feather, None, mode, lab_refs),
+                (w, h))
+
+    def submit(self, colors):
+        """colors: {layer label: BGR} for every painted layer."""
+        with self._cond:
+            if self._layers is None and self._source is None:
+                return
+            self._gen += 1
+            self._pending = (self._gen, dict(colors))
+            self._cond.notify_all()
+
+    def clear(self):
+        """Drop pending and finished results (e.g. back to the select phase)."""
+        with self._cond:
+            self._gen += 1
+            self._pending = None
+            self._results.clear()
+
+    def render(self, colors):
+        """Full-size composite of {layer label: BGR}, computed on the calling thread
+        (after waiting for the compositors, if they are still being built)."""
+        with self._cond:
+            while self._layers is None and self._source is not None and not self._stopped:
+                self._cond.wait()
+            layers = self._layers
+        return layers[0].render(colors) if layers is not None else None
+
+    def poll(self):
+        """Latest finished (image, is_preview) for the current request, or None."""
+        with self._cond:
+            latest = None
+            while self._results:
+                gen, image, is_preview = self._results.popleft()
+                if gen == self._gen:
+                    latest = (image, is_preview)
+            return latest
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._pending is None and self._source is None and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                source = self._source  # Cleared once built, so render() knows to wait
+            if source is not None:
+                with self.prof.stage("build"):
+                    built = self._build(*source)
+                with self._cond:
+                    if self._source is source:  # Not replaced by a newer set_image() meanwhile
+                        self._layers, self._source = built, None
+                    self._cond.notify_all()
+                continue
+
+            with self._cond:
+                if self._pending is None or self._layers is None:
+                    continue
+                gen, colors = self._pending
+                self._pending = None
+                layers, preview_layers, size = self._layers
+
+            with self.prof.stage("preview"):
+                preview = cv2.resize(preview_layers.update(colors), size,
+                                     interpolation=cv2.INTER_LINEAR)
+            with self._cond:
+                if gen != self._gen:
+                    continue  # Superseded while rendering
+                self._results.append((gen, preview, True))
+
+            with self.prof.stage("recolor"):
+                # The compositor keeps updating its buffer; hand out a copy
+                full = layers.update(colors).copy()
+            with self._cond:
+                if gen == self._gen:
+                    self._results.append((gen, full, False))
+
+
+# ── Palette previews ──────────────────────────────────────────
+
+THUMB_HEIGHT = 60      # Thumbnails are rendered at this height
+THUMB_CACHE_PAGES = 8  # Palette pages kept warm (LRU)
+
+
+class ThumbnailCache:
+    """Room thumbnails recolored with every swatch of a palette page.
+
+    One RecolorEngine is built at thumbnail resolution per (image, mask);
+    a page's swatches are then recolored in parallel on a thread pool
+    (OpenCV releases the GIL). Pages are keyed by their colors, so the
+    same swatches in two categories share thumbnails. Finished pages are
+    kept in an LRU and `version` is bumped so the UI knows to redraw the
+    palette.
+    """
+
+    def __init__(self, max_pages=THUMB_CACHE_PAGES, workers=None):
+        self.max_pages = max_pages
+        self._pool = ThreadPoolExecutor(max_workers=workers or min(8, os.cpu_count() or 1))
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._building = set()
+        self._failed = set()  # Pages whose recolor raised; not retried until the image changes
+        self._engine = None
+        self.version = 0
+
+    def set_image(self, original, mask, mode="hsv"):
+        h, w = mask.shape[:2]
+        scale = THUMB_HEIGHT / h
+        size = (max(1, int(w * scale)), THUMB_HEIGHT)
+        small = cv2.resize(original, size, interpolation=cv2.INTER_AREA)
+        small_mask = cv2.resize(mask, size, interpolation=cv2.INTER_NEAREST)
+        with self._lock:
+            self._engine = RecolorEngine(small, small_mask, mode=mode)
+            self._cache.clear()
+            self._building.clear()
+            self._failed.clear()
+            self.version += 1
+
+    def get(self, swatches):
+        """Thumbnails for (name, bgr) swatches, or None while they are still being built."""
+        key = tuple(tuple(bgr) for _, bgr in swatches)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        self.warm([swatches])
+        return None
+
+    def warm(self, pages):
+        keys = [tuple(tuple(bgr) for _, bgr in swatches) for swatches in pages]
+        with self._lock:
+            engine = self._engine
+            if engine is None:
+                return
+            todo = [k for k in dict.fromkeys(keys)
+                    if k not in self._cache and k not in self._building and k not in self._failed]
+            self._building.update(todo)
+        for key in todo:
+            self._submit(engine, key)
+
+    def _submit(self, engine, key):
+        # One task per swatch; the last one to finish stores the page
+        futures = [self._pool.submit(engine.recolor, bgr) for bgr in key]
+        remaining = [len(futures)]
+
+        def done(_):
+            with self._lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+                if engine is not self._engine:
+                    return  # Image changed while building
+                self._building.discard(key)
+                if any(f.cancelled() for f in futures):
+                    return  # Shutting down
+                errors = [f.exception() for f in futures if f.exception()]
+                if errors:
+                    self._failed.add(key)
+                    print(f"  !! Palette previews failed: {errors[0]!r}")
+                    return
+                self._cache[key] = [f.result() for f in futures]
+                while len(self._cache) > self.max_pages:
+                    self._cache.popitem(last=False)
+                self.version += 1
+
+        for f in futures:
+            f.add_done_callback(done)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+# ── Profiling ─────────────────────────────────────────────────
+
+PROFILE_ENV = "ROOMPAINT_PROFILE"  # =1 to start with the HUD on, or =path/to/trace.json
+TRACE_FILE = "roompaint_trace.json"
+PROFILE_WINDOW = 120    # Samples per stage used for p50/p95
+TRACE_EVENTS = 20000    # Rolling trace length
+
+
+class FrameProfiler:
+    """Opt-in per-stage timing for the render loop and recolors.
+
+    stage(name) is a context manager; while disabled it returns one shared
+    no-op context, so instrumented code pays only a method call. While
+    enabled, durations feed per-stage rolling windows (p50/p95 in the HUD)
+    and a rolling Chrome trace (chrome://tracing, Perfetto).
+    """
+
+    _OFF = contextlib.nullcontext()
+
+    def __init__(self, enabled=False, trace_path=TRACE_FILE):
+        self.enabled = enabled
+        self.trace_path = trace_path
+        self.samples = {}
+        self.events = deque(maxlen=TRACE_EVENTS)
+        self._ticks = deque(maxlen=PROFILE_WINDOW)
+        self._t0 = time.perf_counter()
+
+    @classmethod
+    def from_env(cls):
+        value = os.environ.get(PROFILE_ENV, "")
+        if value in ("", "0"):
+            return cls()
+        return cls(True, TRACE_FILE if value == "1" else value)
+
+    def stage(self, name):
+        if not self.enabled:
+            return self._OFF
+        return self._timed(name)
+
+    @contextlib.contextmanager
+    def _timed(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            t1 = time.perf_counter()
+            self.samples.setdefault(name, deque(maxlen=PROFILE_WINDOW)).append((t1 - t0) * 1000)
+            self.events.append((name, t0, t1, threading.get_ident()))
+
+    def tick(self):
+        """Call once per loop iteration (for FPS)."""
+        if self.enabled:
+            self._ticks.append(time.perf_counter())
+
+    def toggle(self):
+        if self.enabled:
+            self.dump()
+        self.enabled = not self.enabled
+        self.samples.clear()
+        self._ticks.clear()
+
+    def fps(self):
+        if len(self._ticks) < 2:
+            return 0.0
+        return (len(self._ticks) - 1) / (self._ticks[-1] - self._ticks[0])
+
+    def hud(self, img, pos=(10, 90)):
+        x, y = pos
+        put_text(img, f"FPS {self.fps():5.1f}   p50 / p95 ms", (x, y), 0.45, (0, 255, 255))
+        for name, window in sorted(self.samples.items()):
+            ms = sorted(window)
+            p50 = ms[len(ms) // 2]
+            p95 = ms[min(len(ms) - 1, int(len(ms) * 0.95))]
+            y += 18
+            put_text(img, f"{name:<9}{p50:6.2f} {p95:6.2f}", (x, y), 0.45, (0, 255, 255))
+
+    def dump(self, path=None):
+        """Write the rolling trace as Chrome trace JSON."""
+        path = path or self.trace_path
+        if not self.events:
+            return None
+        pid = os.getpid()
+        trace = [{"name": name, "ph": "X", "pid": pid, "tid": tid,
+                  "ts": (t0 - self._t0) * 1e6, "dur": (t1 - t0) * 1e6}
+                 for name, t0, t1, tid in list(self.events)]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f)
+        print(f"  >> Trace written to {path} ({len(trace)} events)")
+        return path
+
+
+# ── Zoom pyramid ──────────────────────────────────────────────
+
+PYRAMID_TILE = 256      # Pyramid levels are rasterized and recolored in tiles of this size
+PYRAMID_CACHE_MB = 128  # Rendered pyramid tiles kept (LRU beyond this)
+PIXEL_ZOOM_MAX = 8      # Zoom stops at this many screen pixels per photo pixel
+
+
+class ViewPyramid:
+    """Mipmaps of the full-resolution photo for the zoomed viewport.
+
+    levels[0] is the photo, each next level half the size, down to the
+    last one still larger than the working image. A zoomed view samples
+    the coarsest level at least as sharp as the screen, so its cost does
+    not grow with the zoom. Label maps and recolors are rasterized from
+    the selection polygons (photo coordinates) per level and tile, only
+    for tiles that reach the screen, and kept in a byte-capped LRU.
+    """
+
+    def __init__(self, full, scale, tile=PYRAMID_TILE, budget_mb=PYRAMID_CACHE_MB):
+        self.scale = scale  # Working image size / photo size
+        self.tile = tile
+        self.levels = [full]
+        while self.levels[-1].shape[1] / 2 > full.shape[1] * scale:
+            self.levels.append(cv2.pyrDown(self.levels[-1]))
+        self.budget = int(budget_mb * 2**20)
+        self.nbytes = 0
+        self._cache = OrderedDict()  # key -> (value, nbytes)
+        self._polys = {}             # level -> polygons and cuts in its coordinates
+        self._version = None
+
+    def level_scale(self, k):
+        return self.levels[k].shape[1] / self.levels[0].shape[1]
+
+    def level_for(self, zoom):
+        """Coarsest level with at least as many pixels per photo pixel as the screen."""
+        need = zoom * self.scale
+        k = len(self.levels) - 1
+        while k > 0 and self.level_scale(k) < need:
+            k -= 1
+        return k
+
+    def _get(self, key, make):
+        entry = self._cache.get(key)
+        if entry is not None:
+            self._cache.move_to_end(key)
+            return entry[0]
+        value, nbytes = make()
+        self._cache[key] = (value, nbytes)
+        self.nbytes += nbytes
+        while self.nbytes > self.budget and len(self._cache) > 1:
+            self.nbytes -= self._cache.popitem(last=False)[1][1]
+        return value
+
+    def _tile_labels(self, k, tx, ty, selection):
+        """Label map of one tile plus the feather halo, and its origin."""
+        version, polys, cuts, layers, feather = selection[:5]
+        if version != self._version:
+            self._polys, self._version = {}, version
+        if k not in self._polys:
+            s = self.level_scale(k)
+            self._polys[k] = (scale_polys(polys, s),
+                              [(n, pts) for (n, _), pts in zip(cuts, scale_polys([p for _, p in cuts], s))])
+        level_polys, level_cuts = self._polys[k]
+        h, w = self.levels[k].shape[:2]
+        halo = feather_radius(feather)
+        x1, y1 = max(0, tx - halo), max(0, ty - halo)
+        x2, y2 = min(w, tx + self.tile + halo), min(h, ty + self.tile + halo)
+        labels = fill_selection(np.zeros((y2 - y1, x2 - x1), np.uint8), level_polys, level_cuts,
+                                offset=(-x1, -y1), values=layers)
+        return (labels, (x1, y1)), labels.nbytes
+
+    @staticmethod
+    def _sized(array):
+        return array, array.nbytes
+
+    def _tile_layers(self, k, labels, origin, feather, mode, lab_refs):
+        x1, y1 = origin
+        y2, x2 = y1 + labels.shape[0], x1 + labels.shape[1]
+        layers = LayerCompositor(self.levels[k][y1:y2, x1:x2], labels, feather, None, mode, lab_refs)
+        return layers, layers.nbytes - layers.original.nbytes
+
+    def render(self, k, rect, selection, colors=None, labels=False):
+        """Level-k pixels of rect (x1, y1, x2, y2), recolored with {label: bgr} if
+        given, and the rect's label map if labels (else None).
+
+        selection is (version, polygons, cuts, polygon layers, feather,
+        recolor mode, lab_refs); cached tiles are keyed on the version, so
+        bump it whenever the geometry, the feather or the mode changes.
+        lab_refs come from the working image, so every level and tile maps
+        lightness with the same table.
+        """
+        x1, y1, x2, y2 = rect
+        image = self.levels[k][y1:y2, x1:x2]
+        colors = {l: c for l, c in (colors or {}).items() if c is not None}
+        if not colors and not labels:
+            return image, None
+        if colors:
+            image = image.copy()
+        label_map = np.zeros((y2 - y1, x2 - x1), np.uint8) if labels else None
+        version, t = selection[0], self.tile
+        color_key = tuple(sorted(colors.items()))
+        for ty in range(y1 // t * t, y2, t):
+            for tx in range(x1 // t * t, x2, t):
+                key = (k, tx, ty, version)
+                tile_labels, (hx, hy) = self._get(
+                    ("labels",) + key, lambda: self._tile_labels(k, tx, ty, selection))
+                ix1, iy1, ix2, iy2 = max(x1, tx), max(y1, ty), min(x2, tx + t), min(y2, ty + t)
+                src = (slice(iy1 - hy, iy2 - hy), slice(ix1 - hx, ix2 - hx))
+                dst = (slice(iy1 - y1, iy2 - y1), slice(ix1 - x1, ix2 - x1))
+                if labels:
+                    label_map[dst] = tile_labels[src]
+                if not colors or not tile_labels.any():
+                    continue
+                layers = self._get(("layers",) + key,
+                                   lambda: self._tile_layers(k, tile_labels, (hx, hy), *selection[4:]))
+                out = self._get(("color",) + key + (color_key,),
+                                lambda: self._sized(layers.render(colors)))
+                image[dst] = out[src]
+        return image, label_map
+
+    def clear(self):
+        self._cache.clear()
+        self.nbytes = 0
+
+
+# ── Compare gallery ───────────────────────────────────────────
+
+GALLERY_ENV = "ROOMPAINT_GALLERY_MB"  # Overrides GALLERY_CACHE_MB
+GALLERY_CACHE_MB = 64                 # Rendered snapshot tiles kept (LRU beyond this)
+
+
+def gallery_layout(n, img_w, img_h, max_w, max_h):
+    """(cols, rows, tile_w, tile_h) for n same-size tiles filling max_w x max_h best."""
+    best = None
+    for cols in range(1, n + 1):
+        rows = -(-n // cols)
+        scale = min(max_w / (cols * img_w), max_h / (rows * img_h))
+        if best is None or scale > best[0]:
+            best = (scale, cols, rows)
+    scale, cols, rows = best
+    return cols, rows, max(1, int(img_w * scale)), max(1, int(img_h * scale))
+
+
+class GalleryCache:
+    """Compare tiles rendered lazily from layer colors, kept in a byte-capped LRU.
+
+    A snapshot is only its {layer label: BGR} colors; the tile is
+    rendered (render(colors) -> full-size image, then scaled to the tile)
+    the first time it is shown and re-rendered if it was evicted since.
+    colors=None is the unpainted original.
+    """
+
+    def __init__(self, original, render=None, budget_mb=None):
+        if budget_mb is None:
+            budget_mb = float(os.environ.get(GALLERY_ENV, GALLERY_CACHE_MB))
+        self.original = original
+        self.render = render
+        self.budget = int(budget_mb * 2**20)
+        self.nbytes = 0
+        self.renders = 0
+        self._tiles = OrderedDict()  # (colors key, size) -> tile
+
+    def tile(self, colors, size):
+        key = (None if colors is None else tuple(sorted(colors.items())), size)
+        tile = self._tiles.get(key)
+        if tile is not None:
+            self._tiles.move_to_end(key)
+            return tile
+        full = self.original if colors is None or self.render is None else self.render(colors)
+        tile = cv2.resize(full, size, interpolation=cv2.INTER_AREA)
+        self.renders += 1
+        self._tiles[key] = tile
+        self.nbytes += tile.nbytes
+        # Always keep the tile just rendered, even over budget
+        while self.nbytes > self.budget and len(self._tiles) > 1:
+            self.nbytes -= self._tiles.popitem(last=False)[1].nbytes
+        return tile
+
+    def clear(self):
+        self._tiles.clear()
+        self.nbytes = 0
+
+
+# ── Rendering ─────────────────────────────────────────────────
+
+class FrameRenderer:
+    """Retained-mode compositor for the main window.
+
+    Layers are cached and only rebuilt when invalidated by an event:
+      base    - recolored (or original) image
+      mask    - selection overlay, active layer outline
+      annot   - points/lines of the polygon being traced
+      palette - palette bar (also keyed on width and category)
+      ref     - compare-mode gallery (Original + snapshots)
+      view    - zoom/pan, i.e. only the crop and resize are redone
+    Zoomed-in views are sampled from the ViewPyramid (photo resolution)
+    when there is one; selection points are in photo coordinates.
+    With nothing invalid, render() hands back the last frame untouched.
+    """
+
+    LAYERS = ("base", "mask", "annot", "palette", "ref", "view")
+
+    def __init__(self, original, cmp_w, cmp_h, gallery=None, pyramid=None):
+        self.original = original
+        self.pyramid = pyramid
+        self.scale = pyramid.scale if pyramid is not None else 1.0  # working / photo
+        self.cmp_w, self.cmp_h = cmp_w, cmp_h
+        self.gallery = gallery or GalleryCache(original)  # snapshot tiles
+        self.layout = None        # (cols, rows, tile_w, tile_h) of the last compare frame
+        self.dirty = set(self.LAYERS)
+        self.frame = None
+        self.active_cmp = None    # overlaid image at tile size
+        self._annot = None        # cached _draw_annotations() result
+        self._outline = None      # contours of the active layer
+        self.prof = FrameProfiler()  # disabled unless main() swaps in an enabled one
+        self.thumbs = None        # optional ThumbnailCache for the palette
+        self._palette_key = None
+        self._palette = None
+        self.frame_ms = deque(maxlen=120)
+        self.idle_frames = 0
+
+    def invalidate(self, *layers):
+        self.dirty.update(layers or self.LAYERS)
+
+    def palette(self, canvas_width, cat_idx, show_thumbs=False, page=0):
+        thumbs = None
+        if show_thumbs and self.thumbs is not None:
+            thumbs = self.thumbs.get(palette_page(CATEGORY_NAMES[cat_idx], page, canvas_width))
+        key = (canvas_width, cat_idx, page, thumbs is not None)
+        if "palette" in self.dirty or key != self._palette_key:
+            self._palette = draw_palette(canvas_width, cat_idx, thumbs, page)
+            self._palette_key = key
+        return self._palette
+
+    def _base(self, S):
+        return S["recolored"] if S["recolored"] is not None else self.original
+
+    def compare_layout(self, S):
+        """Grid for Original + snapshots + the live image; two tiles is the classic 2-up."""
+        h, w = self.original.shape[:2]
+        return gallery_layout(len(S["snapshots"]) + 2, w, h, 2 * self.cmp_w, max(self.cmp_h, h))
+
+    @staticmethod
+    def _draw_annotations(pts, margin=6):
+        """Draw the traced polygon on a canvas around its points.
+
+        The canvas always contains the whole drawing, so lines are never
+        clipped differently depending on which ROI is on screen.
+        Returns (x0, y0, color, drawn_mask).
+        """
+        if not pts:
+            return 0, 0, np.zeros((0, 0, 3), np.uint8), np.zeros((0, 0), np.uint8)
+        arr = np.array(pts)
+        x0, y0 = arr.min(axis=0) - margin
+        x1, y1 = arr.max(axis=0) + margin + 1
+        color = np.zeros((y1 - y0, x1 - x0, 3), np.uint8)
+        drawn = np.zeros((y1 - y0, x1 - x0), np.uint8)
+        pts = [(x - x0, y - y0) for x, y in pts]
+        # Same strokes twice: once in color, once as the coverage mask
+        for img, red, yellow in ((color, (0, 0, 255), (0, 255, 255)), (drawn, 255, 255)):
+            for i in range(len(pts)):
+                cv2.circle(img, pts[i], 4, red, -1)
+                if i > 0: cv2.line(img, pts[i-1], pts[i], red, 2)
+            if len(pts) > 2:
+                cv2.line(img, pts[-1], pts[0], yellow, 1)
+        return int(x0), int(y0), color, drawn
+
+    @staticmethod
+    def _paste_annotations(image, annot, x0, y0):
+        """Copy a _draw_annotations() canvas into image, whose origin is at (x0, y0)."""
+        ax, ay, color, drawn = annot
+        rh, rw = image.shape[:2]
+        ix1, iy1 = max(x0, ax), max(y0, ay)
+        ix2, iy2 = min(x0 + rw, ax + drawn.shape[1]), min(y0 + rh, ay + drawn.shape[0])
+        if ix1 < ix2 and iy1 < iy2:
+            cv2.copyTo(color[iy1-ay:iy2-ay, ix1-ax:ix2-ax], drawn[iy1-ay:iy2-ay, ix1-ax:ix2-ax],
+                       image[iy1-y0:iy2-y0, ix1-x0:ix2-x0])
+
+    def _zoomed_view(self, S, panel_w, panel_h, zoom):
+        """Zoomed panel sampled from the pyramid, decorated at screen resolution."""
+        pyr = self.pyramid
+        k = pyr.level_for(zoom)
+        level = pyr.levels[k]
+        f = pyr.level_scale(k) / self.scale  # Level pixels per working pixel
+        a = zoom / f  # Screen pixels per level pixel
+        # Whole level pixels under the panel; the sub-pixel rest is cropped after scaling
+        ox, oy = S["offset_x"] * f, S["offset_y"] * f
+        x1, y1 = int(ox), int(oy)
+        x2 = min(level.shape[1], x1 + int(np.ceil(panel_w / a)) + 2)
+        y2 = min(level.shape[0], y1 + int(np.ceil(panel_h / a)) + 2)
+        sx, sy = int((ox - x1) * a), int((oy - y1) * a)
+
+        recolor = S["phase"] == "RECOLOR"
+        colors = {l: c for l, (_, c) in S["layer_colors"].items()} if recolor else None
+        outline = recolor and len(set(S["poly_layers"])) > 1
+        overlay = S["overlay"] and (not recolor or S["final_mask"] is not None)
+        selection = (S["sel_version"], S["closed_polys"], S["cut_polys"], S["poly_layers"],
+                     S["feather"], S["recolor_mode"], S["lab_refs"])
+        image, labels = pyr.render(k, (x1, y1, x2, y2), selection, colors, overlay or outline)
+
+        def to_panel(img, interpolation):
+            # resize is several times faster than an equivalent warpAffine
+            size = (round((x2 - x1) * a), round((y2 - y1) * a))
+            out = cv2.resize(img, size, interpolation=interpolation)[sy:sy+panel_h, sx:sx+panel_w]
+            if out.shape[:2] != (panel_h, panel_w):  # Rounding at the photo's edge
+                out = cv2.copyMakeBorder(out, 0, panel_h - out.shape[0], 0, panel_w - out.shape[1],
+                                         cv2.BORDER_REPLICATE)
+            return np.ascontiguousarray(out)
+
+        panel = to_panel(image, cv2.INTER_LINEAR)
+        if labels is not None:
+            labels = to_panel(labels, cv2.INTER_NEAREST)
+            if overlay:
+                panel = overlay_mask(panel, labels)
+            if outline:
+                active = cv2.compare(labels, S["layer"], cv2.CMP_EQ)
+                contours = cv2.findContours(active, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[0]
+                cv2.drawContours(panel, contours, -1, (0, 255, 255), 1)
+        if not recolor:
+            pts = [(round((x * self.scale - S["offset_x"]) * zoom),
+                    round((y * self.scale - S["offset_y"]) * zoom)) for x, y in S["current_poly"]]
+            self._paste_annotations(panel, self._draw_annotations(pts), 0, 0)
+        return panel
+
+    def _decorate(self, S, image, x0=0, y0=0):
+        """Overlay and annotations for a copy of the working image region at (x0, y0)."""
+        rh, rw = image.shape[:2]
+        if S["phase"] == "SELECT":
+            if S["overlay"]:
+                image = overlay_mask(image, S["mask"][y0:y0+rh, x0:x0+rw])
+
+            if self._annot is None or "annot" in self.dirty:
+                self._annot = self._draw_annotations(
+                    [(round(x * self.scale), round(y * self.scale)) for x, y in S["current_poly"]])
+            self._paste_annotations(image, self._annot, x0, y0)
+
+        elif S["phase"] == "RECOLOR":
+            if S["overlay"] and S["final_mask"] is not None:
+                image = overlay_mask(image, S["final_mask"][y0:y0+rh, x0:x0+rw])
+            if len(set(S["poly_layers"])) > 1:
+                if self._outline is None or "mask" in self.dirty:
+                    active = cv2.compare(S["labels"], S["layer"], cv2.CMP_EQ)
+                    self._outline = cv2.findContours(active, cv2.RETR_EXTERNAL,
+                                                     cv2.CHAIN_APPROX_SIMPLE)[0]
+                cv2.drawContours(image, self._outline, -1, (0, 255, 255), 1, offset=(-x0, -y0))
+        return image
+
+    def render(self, S):
+        """Returns (frame, changed); changed is False when the cached frame was reused."""
+        if not self.dirty and self.frame is not None:
+            self.idle_frames += 1
+            return self.frame, False
+        t0 = time.perf_counter()
+
+        if S["compare_mode"]:
+            self.layout = cols, rows, panel_w, panel_h = self.compare_layout(S)
+        else:
+            cols, rows = 1, 1
+            panel_w, panel_h = self.original.shape[1], self.original.shape[0]
+
+        prof = self.prof
+        with prof.stage("palette"):
+            palette_bar, ui_map = self.palette(panel_w * cols, S["cat_idx"],
+                                               S["show_thumbs"] and S["phase"] == "RECOLOR",
+                                               S["page"])
+        S["ui_map"] = ui_map
+
+        # 1. Work out the visible ROI first; everything below touches only it
+        zoom = S["zoom_level"]
+        if S["compare_mode"]:
+            # Compare panels are downscaled, so cache the resized image and
+            # redo it only when its content or the tile size changes, never on pan/zoom
+            if (self.active_cmp is None or self.dirty & {"base", "mask", "annot"}
+                    or self.active_cmp.shape[:2] != (panel_h, panel_w)):
+                with prof.stage("overlay"):
+                    full = self._decorate(S, self._base(S).copy())
+                with prof.stage("resize"):
+                    self.active_cmp = cv2.resize(full, (panel_w, panel_h),
+                                                 interpolation=cv2.INTER_AREA)
+        else:
+            self.active_cmp = None
+
+        # ROI is from offset_x, offset_y with size (panel_w/zoom, panel_h/zoom)
+        roi_w = max(1, int(panel_w / zoom))
+        roi_h = max(1, int(panel_h / zoom))
+
+        # Safe crop
+        ox = int(S["offset_x"])
+        oy = int(S["offset_y"])
+        if ox + roi_w > panel_w: ox = panel_w - roi_w
+        if oy + roi_h > panel_h: oy = panel_h - roi_h
+
+        # 2. Overlay + annotations on the ROI only, then scale it to the panel
+        if zoom > 1 and self.pyramid is not None and not S["compare_mode"]:
+            with prof.stage("pyramid"):
+                active_panel = self._zoomed_view(S, panel_w, panel_h, zoom)
+        else:
+            with prof.stage("overlay"):
+                if S["compare_mode"]:
+                    cropped = self.active_cmp[oy:oy+roi_h, ox:ox+roi_w]
+                else:
+                    cropped = self._decorate(S, self._base(S)[oy:oy+roi_h, ox:ox+roi_w].copy(), ox, oy)
+            with prof.stage("resize"):
+                active_panel = cv2.resize(cropped, (panel_w, panel_h), interpolation=cv2.INTER_NEAREST)
+
+        put_text(active_panel, f"Zoom: {zoom:.1f}x", (panel_w - 120, 30))
+        if self.frame_ms:
+            put_text(active_panel, f"{self.frame_ms[-1]:.1f} ms", (panel_w - 120, 52), 0.45, (200, 200, 200))
+
+        # 3. Assemble Frame
+        with prof.stage("stack"):
+            if S["compare_mode"]:
+                # Synced zoom: every tile shows the same ROI; tiles are cached
+                # at tile size, so a pan only crops and scales the visible part
+                panels = []
+                for name, colors in [("Original", None)] + S["snapshots"]:
+                    tile = self.gallery.tile(colors, (panel_w, panel_h))
+                    panel = cv2.resize(tile[oy:oy+roi_h, ox:ox+roi_w], (panel_w, panel_h),
+                                       interpolation=cv2.INTER_NEAREST)
+                    put_text(panel, f"Ref: {name}", (10, 30), 0.55, (200, 200, 255))
+                    panels.append(panel)
+                cv2.rectangle(active_panel, (0, 0), (panel_w - 1, panel_h - 1), (0, 255, 255), 2)
+                panels.append(active_panel)
+                panels += [np.zeros_like(active_panel)] * (cols * rows - len(panels))
+                for panel in panels[:-1]:
+                    cv2.line(panel, (panel_w-1, 0), (panel_w-1, panel_h), (255,255,255), 2)
+                grid = np.vstack([np.hstack(panels[r * cols:(r + 1) * cols]) for r in range(rows)])
+                frame = np.vstack([grid, palette_bar])
+                put_text(frame, "[C] Close Compare  [V] Snapshot  [O] Clear  [Scroll] Zoom",
+                         (20, frame.shape[0] - PALETTE_HEIGHT - 10), 0.5, (0, 255, 255))
+            else:
+                frame = np.vstack([active_panel, palette_bar])
+                stage = "SELECT" if S["phase"] == "SELECT" else "RECOLOR"
+                if stage == "SELECT":
+                    if S["auto_fill"]:
+                        txt = f"[{stage}] AUTO Click=Add RClick=Cut A=Manual"
+                    else:
+                        txt = f"[{stage}] Scroll=Zoom Drag=Pan ENTER=Close A=Auto"
+                else:
+                    txt = f"[{stage}] C=Compare Mode Scroll=Zoom"
+                    n_layers = len(set(S["poly_layers"]))
+                    if n_layers > 1:
+                        txt += f"  Layer {S['layer']}/{n_layers} (click a wall)"
+                put_text(frame, txt, (10, 60), 0.5, (200, 200, 200))
+
+        self.frame = frame
+        self.dirty.clear()
+        self.frame_ms.append((time.perf_counter() - t0) * 1000)
+        return frame, True
+
+    def report(self):
+        if not self.frame_ms:
+            return
+        ms = sorted(self.frame_ms)
+        print(f"  >> Render: {len(ms)} recent frames, avg {sum(ms) / len(ms):.1f} ms, "
+              f"p95 {ms[min(len(ms) - 1, int(len(ms) * 0.95))]:.1f} ms, "
+              f"{self.idle_frames} idle frames reused")
+
+
+# ── Undo / redo ───────────────────────────────────────────────
+
+HISTORY_LIMIT = 1000  # Oldest entries are dropped beyond this
+
+
+def list_op(S, key, index, inserted, count=0):
+    """Replace S[key][index:index+count] with inserted; returns the recorded op."""
+    removed = S[key][index:index + count]
+    S[key][index:index + count] = inserted
+    return ("list", key, index, removed, list(inserted))
+
+
+def value_op(S, key, value):
+    """Set S[key] = value; returns the recorded op. Values are replaced, never mutated."""
+    before, S[key] = S[key], value
+    return ("value", key, before, value)
+
+
+def labels_op(labels, before, bbox):
+    """Op for an edit of labels inside bbox, given the bbox crop from before it.
+
+    Stores the XOR of the two crops, run-length encoded and compressed:
+    a filled shape is a couple of runs per row, whatever its area.
+    """
+    x1, y1, x2, y2 = bbox
+    diff = np.bitwise_xor(before, labels[y1:y2, x1:x2]).reshape(-1)
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(diff)) + 1))
+    runs = np.diff(np.append(starts, diff.size)).astype(np.uint32)
+    data = zlib.compress(runs.tobytes() + diff[starts].tobytes(), 1)
+    return ("labels", bbox, len(runs), data)
+
+
+class EditHistory:
+    """Undo/redo stacks of edits stored as compact deltas.
+
+    An edit is a name plus a list of ops: list splices (points, polygons,
+    cuts, layers), swapped values (colors, active layer, phase, compare
+    reference) and label-map deltas limited to the edited bounding box.
+    Nothing derived from the state (mask, recolored image, reference
+    panel) is stored; main() recomputes it from the keys an undo touched.
+    """
+
+    def __init__(self, limit=HISTORY_LIMIT):
+        self.limit = limit
+        self._undo = deque()
+        self._redo = []
+
+    def push(self, name, ops):
+        if ops:
+            self._undo.append((name, ops))
+            self._redo.clear()
+            while len(self._undo) > self.limit:
+                self._undo.popleft()
+
+    def undo(self, S):
+        """Revert the last edit; returns (name, keys it changed) or None."""
+        if not self._undo:
+            return None
+        name, ops = self._undo.pop()
+        for op in reversed(ops):
+            self._apply(S, op, undo=True)
+        self._redo.append((name, ops))
+        return name, {op[1] if op[0] != "labels" else "labels" for op in ops}
+
+    def redo(self, S):
+        if not self._redo:
+            return None
+        name, ops = self._redo.pop()
+        for op in ops:
+            self._apply(S, op, undo=False)
+        self._undo.append((name, ops))
+        return name, {op[1] if op[0] != "labels" else "labels" for op in ops}
+
+    @staticmethod
+    def _apply(S, op, undo):
+        kind = op[0]
+        if kind == "list":
+            _, key, index, removed, inserted = op
+            old, new = (inserted, removed) if undo else (removed, inserted)
+            S[key][index:index + len(old)] = new
+        elif kind == "value":
+            _, key, before, after = op
+            S[key] = before if undo else after
+        else:
+            # XOR is its own inverse: undo and redo are the same operation
+            _, (x1, y1, x2, y2), n, data = op
+            raw = zlib.decompress(data)
+            runs = np.frombuffer(raw, np.uint32, n)
+            values = np.frombuffer(raw, np.uint8, n, offset=4 * n)
+            labels = S["labels"][y1:y2, x1:x2]
+            labels ^= np.repeat(values, runs).reshape(labels.shape)
+            S["mask"][y1:y2, x1:x2] = cv2.compare(labels, 0, cv2.CMP_GT)
+
+    @property
+    def nbytes(self):
+        """Bytes held by the label-map deltas (the other ops share objects with S)."""
+        return sum(len(op[3]) for _, ops in (*self._undo, *self._redo)
+                   for op in ops if op[0] == "labels")
+
+    def __len__(self):
+        return len(self._undo)
+
+
 # ── Main ──────────────────────────────────────────────────────
 
-def main():
-    original = cv2.imread(IMAGE_PATH)
-    if original is None:
-        print(f"ERROR: Could not load '{IMAGE_PATH}'")
+def main(image_path=IMAGE_PATH, project_path=None):
+    catalog = load_catalogs([p for p in os.environ.get(CATALOG_ENV, "").split(os.pathsep) if p])
+    project = None
+    if project_path:
+        project = load_project(project_path)
+        image_path = project.image_path
+        if not project.image_matches():
+            print(f"  !! '{image_path}' changed since the project was saved")
+
+    full = cv2.imread(image_path)
+    if full is None:
+        print(f"ERROR: Could not load '{image_path}'")
         return
 
-    h_orig, w_orig = original.shape[:2]
+    h_orig, w_orig = full.shape[:2]
     # Resize to max screen width if too huge
-    scale_factor = 1.0
+    original, scale_factor = full, 1.0
     if w_orig > MAX_W:
         scale_factor = MAX_W / w_orig
-        original = cv2.resize(original, None, fx=scale_factor, fy=scale_factor, interpolation=cv2.INTER_AREA)
+        original = cv2.resize(full, None, fx=scale_factor, fy=scale_factor, interpolation=cv2.INTER_AREA)
 
     h, w = original.shape[:2] # Working resolution
 
     # Compare mode sizes
     cmp_w = int(w * COMPARE_SCALE)
     cmp_h = int(h * COMPARE_SCALE)
-    original_small = cv2.resize(original, (cmp_w, cmp_h), interpolation=cv2.INTER_AREA)
 
-    # State
+    # State; points are in photo (full resolution) coordinates, rasters at working size
     S = {
         "mask":       np.zeros((h, w), dtype=np.uint8),
         "current_poly": [],
         "closed_polys": [],
+        "cut_polys":  [],     # (n, points): cleared from the first n closed_polys
+        "sel_version": 0,     # Bumped whenever the polygons change (zoom pyramid cache key)
+        "feather":    "gaussian",  # Wall edge blend, one of FEATHER_MODES
+        "recolor_mode": "hsv",     # One of RECOLOR_MODES
+        "lab_refs":   None,   # {layer: mean wall lightness} in the "lab" mode
+        "auto_fill":  False,
+        # LAYERS: every closed shape / filled region is its own layer
+        "labels":     np.zeros((h, w), dtype=np.uint8),  # 0 = unselected
+        "poly_layers": [],    # Layer label of each closed_polys entry
+        "layer_colors": {},   # label -> (name, bgr)
+        "layer":      0,      # Active layer (palette clicks paint it)
         "phase":      "SELECT",
         "overlay":    True,
         "color_name": None,
         "color_bgr":  None,
         "recolored":  None,
         "final_mask": None,
+        "pick_custom": False,
+        "show_thumbs": False,
         "cat_idx":    0,
+        "page":       0,      # Palette page within the category
         "ui_map":     None,
         "compare_mode": False,
-        "ref_image":    original_small.copy(), 
-        "ref_name":     "Original",
+        "snapshots":    [],    # (name, {label: bgr}) compare gallery tiles
         
         # ZOOM STATE
         "zoom_level": 1.0,  # 1.0 = 100%
@@ -239,17 +1163,70 @@ def main():
         "drag_start": (0,0)
     }
 
+    worker = RecolorWorker()
+    pyramid = ViewPyramid(full, scale_factor)
+    renderer = FrameRenderer(original, cmp_w, cmp_h, GalleryCache(original, worker.render), pyramid)
+    del full  # Level 0 of the pyramid
+    prof = FrameProfiler.from_env()
+    renderer.prof = worker.prof = prof
+    thumbs = ThumbnailCache()
+    renderer.thumbs = thumbs
+    thumbs_seen = thumbs.version
+    history = EditHistory()
+
+    def palette_width():
+        if S["compare_mode"]:
+            cols, _, tile_w, _ = renderer.compare_layout(S)
+            return tile_w * cols
+        return w
+
+    def warm_thumbs(always=False):
+        # Current page plus its neighbours, so paging is instant
+        if S["show_thumbs"] or always:
+            cat_name, pw = CATEGORY_NAMES[S["cat_idx"]], palette_width()
+            pages = palette_pages(cat_name, pw)
+            thumbs.warm([palette_page(cat_name, (S["page"] + d) % pages, pw) for d in (0, 1, -1)])
+
+    def step_palette(d):
+        # The arrows page through a category, then move on to the next one
+        ui = S["ui_map"]
+        if 0 <= ui["page"] + d < ui["pages"]:
+            S["page"] = ui["page"] + d
+        else:
+            S["cat_idx"] = (S["cat_idx"] + d) % len(CATEGORY_NAMES)
+            S["page"] = 0 if d > 0 else palette_pages(CATEGORY_NAMES[S["cat_idx"]], palette_width()) - 1
+        warm_thumbs()
+        renderer.invalidate("palette")
+
+    def show_closest(bgr, what):
+        # Fill the Closest Paints category and switch the palette to it
+        found = catalog.nearest(bgr)
+        CATEGORIES[CLOSEST_CATEGORY] = [(name, c) for name, c, _ in found]
+        if CLOSEST_CATEGORY not in CATEGORY_NAMES:
+            CATEGORY_NAMES.append(CLOSEST_CATEGORY)
+        S["cat_idx"], S["page"] = CATEGORY_NAMES.index(CLOSEST_CATEGORY), 0
+        warm_thumbs()
+        renderer.invalidate("palette")
+        print(f"  >> Closest paints to {what}: " +
+              ", ".join(f"{name} (dE {de:.1f})" for name, _, de in found[:5]))
+
     win = "Wall Color Changer v9"
     cv2.namedWindow(win, cv2.WINDOW_AUTOSIZE)
 
+    def view_size():
+        # (panel w, panel h, height above the palette); compare mode is a grid of panels
+        if S["compare_mode"]:
+            cols, rows, tile_w, tile_h = renderer.compare_layout(S)
+            return tile_w, tile_h, rows * tile_h
+        return w, h, h
+
     # Coordinate Mapper: Screen -> Image
     def screen_to_image(sx, sy):
         # Viewport params
-        frame_h = cmp_h if S["compare_mode"] else h
-        frame_w = cmp_w if S["compare_mode"] else w
+        frame_w, frame_h, grid_h = view_size()
         
         # Check if in palette
-        if sy >= frame_h:
+        if sy >= grid_h:
             return None, "PALETTE"
             
         # In zoomed image?
@@ -262,7 +1239,7 @@ def main():
         
         # Check bounds
         # For SELECT mode, we operate on FULL res image 'original' (up to h,w)
-        # For COMPARE mode, we operate on 'active_panel' (up to cmp_h, cmp_w)
+        # For COMPARE mode, we operate on one gallery panel (tile_w x tile_h)
         limit_w = frame_w if S["compare_mode"] else w
         limit_h = frame_h if S["compare_mode"] else h
         
@@ -270,14 +1247,164 @@ def main():
         # But zoom logic should work on the *displayed* pixels.
         
         if 0 <= ix < limit_w and 0 <= iy < limit_h:
+            if not S["compare_mode"]:
+                ix, iy = ix / scale_factor, iy / scale_factor  # Photo coordinates
             return (ix, iy), "IMAGE"
         
         return None, "OUT"
 
 
+    def next_layer():
+        layer = max(S["poly_layers"], default=0) + 1
+        if layer > 255:
+            print("  !! Layer limit reached, merging into layer 255")
+            layer = 255
+        return layer
+
+    def working_pts(poly):
+        # Photo -> working coordinates in 4-bit fixed point, so fillPoly keeps the sub-pixels
+        return np.round(np.array(poly, np.float64) * scale_factor * 16).astype(np.int32)
+
+    def close_poly():
+        # Each closed shape becomes a new layer; returns the undo ops
+        layer = next_layer()
+        pts = working_pts(S["current_poly"])
+        x1, y1 = np.maximum(pts.min(axis=0) // 16 - 1, 0)
+        x2, y2 = np.minimum(pts.max(axis=0) // 16 + 2, (w, h))
+        before = S["labels"][y1:y2, x1:x2].copy()
+        cv2.fillPoly(S["mask"], [pts], 255, shift=4)
+        cv2.fillPoly(S["labels"], [pts], layer, shift=4)
+        S["sel_version"] += 1
+        return [labels_op(S["labels"], before, (int(x1), int(y1), int(x2), int(y2))),
+                list_op(S, "closed_polys", len(S["closed_polys"]), [S["current_poly"]]),
+                list_op(S, "poly_layers", len(S["poly_layers"]), [layer]),
+                value_op(S, "current_poly", [])]
+
+    def select_layer(layer):
+        S["layer"] = layer
+        S["color_name"], S["color_bgr"] = S["layer_colors"].get(layer, (None, None))
+        thumbs.set_image(original, cv2.compare(S["labels"], layer, cv2.CMP_EQ), S["recolor_mode"])
+        warm_thumbs()
+        renderer.invalidate("mask")
+
+    def layer_bgrs():
+        return {k: c for k, (_, c) in S["layer_colors"].items()}
+
+    def paint(name, bgr):
+        # Color the active layer; the worker only recomposites what changed
+        S["color_name"], S["color_bgr"] = name, bgr
+        history.push(f"Paint {name}", [
+            value_op(S, "layer_colors", {**S["layer_colors"], S["layer"]: (name, bgr)}),
+            value_op(S, "layer", S["layer"])])  # Undo makes the layer active again
+        worker.submit(layer_bgrs())
+
+    def start_recolor():
+        S["final_mask"] = S["mask"].copy()
+        S["lab_refs"] = (wall_lightness(original, S["labels"])
+                         if S["recolor_mode"] == "lab" else None)
+        worker.set_image(original, S["labels"], S["feather"], S["recolor_mode"], S["lab_refs"])
+        renderer.gallery.clear()  # Tiles were rendered from the old layers
+        S["overlay"] = False
+
+    def enter_recolor():
+        ops = [value_op(S, "phase", "RECOLOR"), value_op(S, "layer", int(S["labels"].max()))]
+        start_recolor()
+        select_layer(S["layer"])
+        warm_thumbs(always=True)  # Ready before T is first pressed
+        return ops
+
+    def restore(changed):
+        # Recompute what an undo/redo invalidated from the restored state
+        if "phase" in changed:
+            if S["phase"] == "RECOLOR":
+                start_recolor()
+            else:
+                worker.clear()
+                S["recolored"] = S["final_mask"] = None
+                S["overlay"] = True
+                S["compare_mode"] = False
+            renderer.invalidate()
+        if S["phase"] == "RECOLOR":
+            if "layer_colors" in changed:
+                worker.submit(layer_bgrs())
+            if changed & {"layer", "layer_colors"}:
+                select_layer(S["layer"])
+        if "snapshots" in changed:
+            renderer.invalidate()  # The grid layout may change too
+        if changed & {"closed_polys", "cut_polys", "poly_layers"}:
+            S["sel_version"] += 1
+        if changed & {"labels", "closed_polys", "cut_polys"}:
+            renderer.invalidate("mask")
+        if "current_poly" in changed:
+            renderer.invalidate("annot")
+
+    def undo_redo(redo=False):
+        done = history.redo(S) if redo else history.undo(S)
+        if done is None:
+            print(f"  >> Nothing to {'redo' if redo else 'undo'}")
+            return
+        name, changed = done
+        restore(changed)
+        print(f"  >> {'Redo' if redo else 'Undo'}: {name}")
+
+    if project is not None:
+        # Skip straight to RECOLOR with the saved selection and colors
+        S["closed_polys"] = [[(int(x), int(y)) for x, y in poly] for poly in project.polygons]
+        S["cut_polys"] = [(n, [(int(x), int(y)) for x, y in poly]) for n, poly in project.cuts]
+        S["poly_layers"] = list(project.polygon_layers)
+        S["sel_version"] += 1
+        S["labels"] = project.labels_at(w, h)
+        S["mask"] = cv2.compare(S["labels"], 0, cv2.CMP_GT)
+        if np.count_nonzero(S["mask"]) > 0:
+            S["layer_colors"] = dict(project.layer_colors)
+            enter_recolor()
+            if S["layer_colors"]:
+                worker.submit(layer_bgrs())
+        print(f"  >> Loaded project {project_path}")
+
+    segmenter = None
+
+    def seed_click(ix, iy, add):
+        # Grow a region from the click and merge it like a closed polygon
+        nonlocal segmenter
+        if segmenter is None:
+            segmenter = SeedSegmenter(original)
+        t0 = time.perf_counter()
+        region = segmenter.region(ix * scale_factor, iy * scale_factor)
+        x, y, bw, bh = cv2.boundingRect(region)
+        if bw == 0:
+            return
+        before = S["labels"][y:y+bh, x:x+bw].copy()
+        outer, holes = mask_to_polys(region)
+        ops = []
+
+        def to_photo(polys):
+            return [[(int(x), int(y)) for x, y in p] for p in scale_polys(polys, 1.0 / scale_factor)]
+        if add:
+            # Holes (frames, sockets) only cut what was not selected before
+            hole_mask = fill_selection(np.zeros_like(region), [np.array(p, np.int32) for p in holes])
+            hole_mask[S["mask"] > 0] = 0
+            layer = next_layer()
+            ops += [list_op(S, "closed_polys", len(S["closed_polys"]), to_photo(outer)),
+                    list_op(S, "poly_layers", len(S["poly_layers"]), [layer] * len(outer))]
+            cuts = mask_to_polys(hole_mask)[0]
+            S["mask"] |= region
+            S["labels"][region > 0] = layer
+        else:
+            cuts = mask_to_polys(cv2.bitwise_and(region, S["mask"]))[0]
+            S["mask"][region > 0] = 0
+            S["labels"][region > 0] = 0
+        n = len(S["closed_polys"])
+        ops += [list_op(S, "cut_polys", len(S["cut_polys"]), [(n, pts) for pts in to_photo(cuts)]),
+                labels_op(S["labels"], before, (x, y, x + bw, y + bh))]
+        S["sel_version"] += 1
+        history.push("Auto add" if add else "Auto cut", ops)
+        renderer.invalidate("mask")
+        print(f"  >> Auto {'add' if add else 'cut'}: {cv2.countNonZero(region)} px "
+              f"in {(time.perf_counter() - t0) * 1000:.0f} ms")
+
     def on_mouse(event, mx, my, flags, param):
-        frame_h = cmp_h if S["compare_mode"] else h
-        frame_w = cmp_w if S["compare_mode"] else w
+        frame_w, frame_h, grid_h = view_size()
         
         # HANDLE ZOOM/PAN
         if event == cv2.EVENT_MOUSEWHEEL:
@@ -285,7 +1412,8 @@ def main():
             factor = 1.1 if delta else 0.9
             new_zoom = S["zoom_level"] * factor
             if new_zoom < 1.0: new_zoom = 1.0
-            if new_zoom > 5.0: new_zoom = 5.0
+            # Past the working image the view samples the photo itself
+            if new_zoom > PIXEL_ZOOM_MAX / scale_factor: new_zoom = PIXEL_ZOOM_MAX / scale_factor
             
             # Zoom towards cursor? Simple center zoom for now to avoid drift bugs
             # Or zoom towards mx,my
@@ -300,6 +1428,7 @@ def main():
             new_h_view = frame_h / new_zoom
             S["offset_x"] = max(0, min(cx - new_w_view/2, (frame_w if S["compare_mode"] else w) - new_w_view))
             S["offset_y"] = max(0, min(cy - new_h_view/2, (frame_h if S["compare_mode"] else h) - new_h_view))
+            renderer.invalidate("view")
             return
 
         # PANNING (Middle drag or Left drag if not clicking active)
@@ -329,6 +1458,7 @@ def main():
                  
                  S["offset_x"] = max(0, min(S["offset_x"], img_w - view_w))
                  S["offset_y"] = max(0, min(S["offset_y"], img_h - view_h))
+                 renderer.invalidate("view")
              return
 
         elif event == cv2.EVENT_LBUTTONUP:
@@ -342,33 +1472,27 @@ def main():
              
              if type == "PALETTE":
                  # Palette click logic (handle coordinates relative to palette bar)
-                 py = my - frame_h
+                 py = my - grid_h
                  ui = S["ui_map"]
                  if not ui: return
                  # Copy-paste palette logic...
                  px1, py1, px2, py2 = ui['prev']
                  if px1 <= mx <= px2 and py1 <= py <= py2:
-                    S["cat_idx"] = (S["cat_idx"] - 1) % len(CATEGORY_NAMES)
+                    step_palette(-1)
                     return
                  nx1, ny1, nx2, ny2 = ui['next']
                  if nx1 <= mx <= nx2 and ny1 <= py <= ny2:
-                    S["cat_idx"] = (S["cat_idx"] + 1) % len(CATEGORY_NAMES)
+                    step_palette(1)
                     return
                  cx1, cy1, cx2, cy2 = ui['custom']
                  if cx1 <= mx <= cx2 and cy1 <= py <= cy2:
-                    color = pick_custom_color()
-                    if color:
-                        S["color_name"] = "Custom"
-                        S["color_bgr"] = color
-                        S["recolored"] = recolor_walls(original, S["final_mask"], color)
+                    # Modal dialog: open it from the main loop, not the callback
+                    S["pick_custom"] = True
                     return
                  for swatch in ui['swatches']:
                     sx1, sy1, sx2, sy2 = swatch['rect']
                     if sx1 <= mx <= sx2 and sy1 <= py <= sy2:
-                        S["color_name"] = swatch['name']
-                        S["color_bgr"] = swatch['bgr']
-                        if S["final_mask"] is not None:
-                            S["recolored"] = recolor_walls(original, S["final_mask"], swatch['bgr'])
+                        paint(swatch['name'], swatch['bgr'])
                         return
                  return # End Palette Click
 
@@ -376,18 +1500,41 @@ def main():
                  ix, iy = coords
                  # Phase 1: Select
                  if S["phase"] == "SELECT" and not S["compare_mode"]:
-                     S["current_poly"].append((int(ix), int(iy)))
+                     if S["auto_fill"]:
+                         seed_click(ix, iy, add=True)
+                     else:
+                         history.push("Add point", [list_op(S, "current_poly", len(S["current_poly"]),
+                                                            [(int(ix), int(iy))])])
+                         renderer.invalidate("annot")
+                 # Phase 2: click a wall to make its layer active
+                 elif S["phase"] == "RECOLOR" and not S["compare_mode"]:
+                     layer = int(S["labels"][min(int(iy * scale_factor), h - 1),
+                                             min(int(ix * scale_factor), w - 1)])
+                     if layer and layer != S["layer"]:
+                         select_layer(layer)
 
         elif event == cv2.EVENT_RBUTTONDOWN:
-            if S["phase"] == "SELECT" and S["current_poly"]:
-                S["current_poly"].pop()
+            if S["phase"] == "SELECT" and S["auto_fill"]:
+                coords, type = screen_to_image(mx, my)
+                if type == "IMAGE":
+                    seed_click(*coords, add=False)
+            elif S["phase"] == "SELECT" and S["current_poly"]:
+                history.push("Remove point", [list_op(S, "current_poly", len(S["current_poly"]) - 1,
+                                                      [], 1)])
+                renderer.invalidate("annot")
+            elif S["phase"] == "RECOLOR" and not S["compare_mode"]:
+                # Sample the photo (median of 5x5 pixels) and look it up in the catalogs
+                coords, type = screen_to_image(mx, my)
+                if type == "IMAGE":
+                    x, y = int(coords[0]), int(coords[1])
+                    patch = pyramid.levels[0][max(0, y - 2):y + 3, max(0, x - 2):x + 3]
+                    bgr = tuple(int(c) for c in np.median(patch.reshape(-1, 3), axis=0))
+                    show_closest(bgr, f"the wall at ({x}, {y})")
                 
         elif event == cv2.EVENT_MBUTTONDOWN or (event == cv2.EVENT_LBUTTONDBLCLK): # Mid or DblClick to Close
              if S["phase"] == "SELECT" and len(S["current_poly"]) >= 3:
-                 pts = np.array(S["current_poly"], np.int32)
-                 cv2.fillPoly(S["mask"], [pts], 255)
-                 S["closed_polys"].append(S["current_poly"])
-                 S["current_poly"] = []
+                 history.push("Close shape", close_poly())
+                 renderer.invalidate("mask", "annot")
                  print("  >> Shape Closed.")
 
 
@@ -402,136 +1549,146 @@ def main():
     print("==================================================")
 
     while True:
-        if S["compare_mode"]:
-            panel_w, panel_h = cmp_w, cmp_h
-        else:
-            panel_w, panel_h = w, h
-            
-        palette_bar, ui_map = draw_palette(panel_w * 2 if S["compare_mode"] else panel_w, S["cat_idx"])
-        S["ui_map"] = ui_map
-        
-        # 1. Prepare Full Res Image (with overlays)
-        if S["recolored"] is not None:
-            active_full = S["recolored"].copy() # Copy to avoid lag?
-        else:
-            active_full = original.copy()
-            
-        if S["phase"] == "SELECT":
-             if S["overlay"]: 
-                 active_full = overlay_mask(active_full, S["mask"])
-             
-             pts = S["current_poly"]
-             if len(pts) > 0:
-                 for i in range(len(pts)):
-                     cv2.circle(active_full, pts[i], 4, (0, 0, 255), -1)
-                     if i > 0: cv2.line(active_full, pts[i-1], pts[i], (0, 0, 255), 2)
-                 if len(pts) > 2:
-                     cv2.line(active_full, pts[-1], pts[0], (0, 255, 255), 1)
-
-        elif S["phase"] == "RECOLOR":
-             if S["overlay"] and S["final_mask"] is not None:
-                 active_full = overlay_mask(active_full, S["final_mask"])
+        prof.tick()
+        with prof.stage("render"):
+            frame, changed = renderer.render(S)
+        if prof.enabled:
+            # The HUD changes every tick, so draw it on a copy of the cached frame
+            frame = frame.copy()
+            prof.hud(frame)
+            changed = True
+        if changed:
+            with prof.stage("imshow"):
+                cv2.imshow(win, frame)
 
-        # 2. Extract Zoomed ROI for Active Panel
-        zoom = S["zoom_level"]
-        # If compare mode, we resize active_full to cmp size first? 
-        # No, zoom logic is best applied to the full res overlay for sharpness, THEN resized? 
-        # Or resize first then zoom?
-        # Logic: If compare mode, base image is (cmp_w, cmp_h).
-        
-        if S["compare_mode"]:
-            # Active panel base
-            base = cv2.resize(active_full, (cmp_w, cmp_h), interpolation=cv2.INTER_AREA)
-        else:
-            base = active_full
+        with prof.stage("waitKey"):
+            key = cv2.waitKey(30) & 0xFF
 
-        # Apply Zoom ROI crop
-        # ROI is from offset_x, offset_y with size (panel_w/zoom, panel_h/zoom)
-        roi_w = int(panel_w / zoom)
-        roi_h = int(panel_h / zoom)
-        
-        # Safe crop
-        ox = int(S["offset_x"])
-        oy = int(S["offset_y"])
-        if ox + roi_w > base.shape[1]: ox = base.shape[1] - roi_w
-        if oy + roi_h > base.shape[0]: oy = base.shape[0] - roi_h
-        
-        cropped = base[oy:oy+roi_h, ox:ox+roi_w]
-        # Resize back to panel size
-        active_panel = cv2.resize(cropped, (panel_w, panel_h), interpolation=cv2.INTER_NEAREST)
+        if thumbs.version != thumbs_seen:
+            thumbs_seen = thumbs.version
+            renderer.invalidate("palette")
 
-        label = f"Zoom: {zoom:.1f}x"
-        put_text(active_panel, label, (panel_w - 120, 30))
-        
-        # 3. Assemble Frame
-        if S["compare_mode"]:
-            ref_panel = S["ref_image"].copy()
-            # Does ref panel zoom too? Let's say yes, synced zoom
-            # Ref base is S['ref_image'] which is (cmp_w, cmp_h)
-            ref_cropped = S["ref_image"][oy:oy+roi_h, ox:ox+roi_w]
-            ref_panel_zoomed = cv2.resize(ref_cropped, (panel_w, panel_h), interpolation=cv2.INTER_NEAREST)
-            
-            put_text(ref_panel_zoomed, f"Ref: {S['ref_name']}", (10, 30), 0.55, (200, 200, 255))
-            cv2.line(ref_panel_zoomed, (panel_w-1, 0), (panel_w-1, panel_h), (255,255,255), 2)
-            
-            combined_imgs = np.hstack([ref_panel_zoomed, active_panel])
-            frame = np.vstack([combined_imgs, palette_bar])
-            put_text(frame, "[C] Close Compare  [V] Snapshot  [Scroll] Zoom", 
-                     (20, frame.shape[0] - PALETTE_HEIGHT - 10), 0.5, (0, 255, 255))
-        else:
-            frame = np.vstack([active_panel, palette_bar])
-            stage = "SELECT" if S["phase"] == "SELECT" else "RECOLOR"
-            if stage == "SELECT":
-                txt = f"[{stage}] Scroll=Zoom Drag=Pan ENTER=Close"
-            else:
-                txt = f"[{stage}] C=Compare Mode Scroll=Zoom"
-            put_text(frame, txt, (10, 60), 0.5, (200, 200, 200))
+        done = worker.poll()
+        if done is not None:
+            S["recolored"] = done[0]
+            renderer.invalidate("base")
 
-        cv2.imshow(win, frame)
+        if S["pick_custom"]:
+            S["pick_custom"] = False
+            color = pick_custom_color()
+            if color:
+                paint("Custom", color)
+                show_closest(color, "Custom")
 
-        key = cv2.waitKey(30) & 0xFF
         if key in (ord('q'), ord('Q'), 27): break
         elif key == 32: # SPACE
              if S["phase"] == "SELECT":
+                ops = []
                 if len(S["current_poly"]) >= 3:
-                     # Auto close current
-                     pts = np.array(S["current_poly"], np.int32)
-                     cv2.fillPoly(S["mask"], [pts], 255)
-                     S["closed_polys"].append(S["current_poly"])
-                     S["current_poly"] = []
+                     ops += close_poly()  # Auto close current
                 
                 if np.count_nonzero(S["mask"]) > 0:
-                    S["final_mask"] = S["mask"].copy()
-                    S["phase"] = "RECOLOR"
-                    S["overlay"] = False
+                    ops += enter_recolor()
+                history.push("Finish selection", ops)
+                renderer.invalidate()
         elif key == 13: # ENTER
              if S["phase"] == "SELECT" and len(S["current_poly"]) >= 3:
-                 pts = np.array(S["current_poly"], np.int32)
-                 cv2.fillPoly(S["mask"], [pts], 255)
-                 S["closed_polys"].append(S["current_poly"])
-                 S["current_poly"] = []
+                 history.push("Close shape", close_poly())
+                 renderer.invalidate("mask", "annot")
+        elif key in (ord('z'), ord('Z'), 26):  # 26 = Ctrl+Z
+             undo_redo()
+        elif key in (ord('y'), ord('Y'), 25):  # 25 = Ctrl+Y
+             undo_redo(redo=True)
+        elif key in (ord('a'), ord('A')) and S["phase"] == "SELECT":
+             S["auto_fill"] = not S["auto_fill"]
+             print(f"  >> Auto fill {'ON' if S['auto_fill'] else 'OFF'}")
+             renderer.invalidate("mask")
         elif key in (ord('c'), ord('C')) and S["phase"] == "RECOLOR":
              S["compare_mode"] = not S["compare_mode"]
              # Reset zoom when toggling mode to avoid confusion
              S["zoom_level"] = 1.0
              S["offset_x"] = 0
              S["offset_y"] = 0
-             
+             renderer.invalidate()
+
+        elif key in (ord('f'), ord('F')):
+             prof.toggle()
+             renderer.invalidate()
+
+        elif key in (ord('e'), ord('E')) and S["phase"] == "RECOLOR":
+             S["feather"] = FEATHER_MODES[(FEATHER_MODES.index(S["feather"]) + 1) % len(FEATHER_MODES)]
+             S["sel_version"] += 1  # Pyramid tiles were feathered the old way
+             start_recolor()
+             worker.submit(layer_bgrs())
+             renderer.invalidate()
+             print(f"  >> Edge feather: {S['feather']}")
+
+        elif key in (ord('l'), ord('L')) and S["phase"] == "RECOLOR":
+             S["recolor_mode"] = RECOLOR_MODES[(RECOLOR_MODES.index(S["recolor_mode"]) + 1)
+                                               % len(RECOLOR_MODES)]
+             S["sel_version"] += 1  # Pyramid tiles were recolored the old way
+             start_recolor()
+             select_layer(S["layer"])  # Palette previews follow the mode
+             worker.submit(layer_bgrs())
+             renderer.invalidate()
+             print(f"  >> Recolor mode: {S['recolor_mode']}")
+
+        elif key in (ord('t'), ord('T')) and S["phase"] == "RECOLOR":
+             S["show_thumbs"] = not S["show_thumbs"]
+             warm_thumbs()
+             renderer.invalidate("palette")
+
         elif key in (ord('v'), ord('V')) and S["compare_mode"]:
-             S["ref_image"] = cv2.resize(active_full, (cmp_w, cmp_h), interpolation=cv2.INTER_AREA)
-             S["ref_name"] = S["color_name"] if S["color_name"] else "Custom"
-        elif key in (ord('o'), ord('O')) and S["compare_mode"]:
-             S["ref_image"] = original_small.copy()
-             S["ref_name"] = "Original"
+             # A snapshot is just the colors; its tile is rendered when shown
+             name = S["color_name"] if S["color_name"] else "Custom"
+             history.push("Snapshot", [list_op(S, "snapshots", len(S["snapshots"]),
+                                               [(name, layer_bgrs())])])
+             renderer.invalidate()
+        elif key in (ord('o'), ord('O')) and S["compare_mode"] and S["snapshots"]:
+             history.push("Clear snapshots", [list_op(S, "snapshots", 0, [], len(S["snapshots"]))])
+             renderer.invalidate()
 
         elif key in (ord('s'), ord('S')):
-             # Save logic...
+             # Save at the photo's full resolution, not the working size
              if S["recolored"] is not None:
-                 sp = os.path.join(os.path.dirname(IMAGE_PATH), "recolored_zoom_v9.jpg")
-                 cv2.imwrite(sp, S["recolored"])
-                 print(f"  >> Saved to {sp}")
+                 sp = os.path.join(os.path.dirname(image_path), "recolored_zoom_v9.jpg")
+
+                 def save(polys=list(S["closed_polys"]), cuts=list(S["cut_polys"]),
+                          layers=list(S["poly_layers"]), feather=S["feather"],
+                          mode=S["recolor_mode"], lab_refs=S["lab_refs"],
+                          colors={k: c for k, (_, c) in S["layer_colors"].items()}):
+                     export_full_resolution(image_path, polys, 1.0, colors, sp,
+                                            cuts=cuts, layers=layers, feather=feather,
+                                            mode=mode, lab_refs=lab_refs)
+                     print(f"  >> Saved to {sp} ({w_orig}x{h_orig})")
+                 # Full-res export takes seconds; keep the window responsive
+                 threading.Thread(target=save).start()
+
+        elif key in (ord('p'), ord('P')):
+             pp = project_path or project_path_for(image_path)
+             polys, layers = S["closed_polys"], S["poly_layers"]
+             mask = S["final_mask"] if S["final_mask"] is not None else S["mask"]
+             if len(S["current_poly"]) >= 3:
+                 # Saved as closed: the mask must cover it too, or loading trims it away
+                 polys, layers = polys + [S["current_poly"]], layers + [next_layer()]
+                 mask = mask.copy()
+                 cv2.fillPoly(mask, [working_pts(S["current_poly"])], 255, shift=4)
+             save_project(pp, image_path, (w_orig, h_orig), polys, mask,
+                          S["color_name"], S["color_bgr"], S["cut_polys"],
+                          layers, S["layer_colors"])
+             print(f"  >> Project saved to {pp}")
 
+    worker.stop()
+    thumbs.shutdown()
+    if prof.enabled:
+        prof.dump()
+    renderer.report()
     cv2.destroyAllWindows()
 
 if __name__ == "__main__":
-    main()
+    # color_changer.py [photo | project.roompaint.json]
+    arg = sys.argv[1] if len(sys.argv) > 1 else IMAGE_PATH
+    if arg.endswith(PROJECT_EXT):
+        main(project_path=arg)
+    else:
+        main(arg)
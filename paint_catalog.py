@@ -0,0 +1,170 @@
+"""
+RoomPaint paint catalogs - manufacturer colors with nearest-paint search.
+
+A catalog is a CSV or JSON file of paints:
+
+  name,category,hex                     # CSV: a header row, then one paint per line
+  Sage Green,Greens,#9FBC8E             #   (r,g,b columns work instead of hex)
+
+  [{"name": "Sage Green", "category": "Greens", "hex": "#9FBC8E"}, ...]
+  {"Greens": [{"name": "Sage Green", "rgb": [159, 188, 142]}, ...], ...}
+
+Paints without a category go in one named after the file. Colors are
+kept as BGR (like CATEGORIES) and as CIELAB, the index nearest() searches
+with the CIE76 color difference (Euclidean distance in Lab, "delta E").
+
+Parsing thousands of rows is the slow part, so load_catalog() writes the
+parsed arrays next to the catalog (<file>.index.npz) and reuses them
+until the file changes.
+"""
+
+import csv
+import json
+import os
+
+import cv2
+import numpy as np
+
+INDEX_EXT = ".index.npz"
+NEAREST_K = 12  # Paints returned by nearest()
+
+
+# ── Colors ────────────────────────────────────────────────────
+
+def hex_to_bgr(text):
+    text = text.strip().lstrip("#")
+    if len(text) != 6:
+        raise ValueError(f"bad hex color '{text}'")
+    r, g, b = (int(text[i:i + 2], 16) for i in (0, 2, 4))
+    return (b, g, r)
+
+
+def bgr_to_lab(bgr):
+    """(N, 3) uint8 BGR -> (N, 3) float32 CIELAB (L 0..100, D65)."""
+    bgr = np.asarray(bgr, np.float32).reshape(1, -1, 3) / 255
+    return cv2.cvtColor(bgr, cv2.COLOR_BGR2Lab).reshape(-1, 3)
+
+
+def _channel(value):
+    c = int(value)
+    if not 0 <= c <= 255:
+        raise ValueError(f"color value {c} outside 0-255")
+    return c
+
+
+def _record_bgr(record):
+    """BGR of a CSV/JSON record with hex, rgb/bgr lists, or r, g, b fields."""
+    if record.get("hex"):
+        return hex_to_bgr(record["hex"])
+    if record.get("rgb") is not None:
+        r, g, b = record["rgb"]
+        return (_channel(b), _channel(g), _channel(r))
+    if record.get("bgr") is not None:
+        b, g, r = record["bgr"]
+        return (_channel(b), _channel(g), _channel(r))
+    return (_channel(record["b"]), _channel(record["g"]), _channel(record["r"]))
+
+
+# ── Catalog ───────────────────────────────────────────────────
+
+class PaintCatalog:
+    """Paints as parallel arrays: names, categories, BGR (uint8) and Lab (float32)."""
+
+    def __init__(self, names, categories, bgr, lab=None):
+        self.names = list(names)
+        self.categories = list(categories)
+        self.bgr = np.asarray(bgr, np.uint8).reshape(-1, 3)
+        self.lab = bgr_to_lab(self.bgr) if lab is None else np.asarray(lab, np.float32)
+
+    @classmethod
+    def from_categories(cls, categories):
+        """Catalog of a {category: [(name, bgr), ...]} dict like CATEGORIES."""
+        rows = [(name, cat, bgr) for cat, colors in categories.items() for name, bgr in colors]
+        if not rows:
+            return cls([], [], np.zeros((0, 3), np.uint8))
+        names, cats, bgr = zip(*rows)
+        return cls(names, cats, bgr)
+
+    @classmethod
+    def concat(cls, catalogs):
+        catalogs = list(catalogs)
+        return cls([n for c in catalogs for n in c.names],
+                   [k for c in catalogs for k in c.categories],
+                   np.concatenate([c.bgr for c in catalogs]),
+                   np.concatenate([c.lab for c in catalogs]))
+
+    def __len__(self):
+        return len(self.names)
+
+    def groups(self):
+        """{category: [(name, bgr), ...]} in catalog order, the shape of CATEGORIES."""
+        out = {}
+        for name, cat, bgr in zip(self.names, self.categories, self.bgr.tolist()):
+            out.setdefault(cat, []).append((name, tuple(bgr)))
+        return out
+
+    def nearest(self, bgr, k=NEAREST_K):
+        """The k paints closest to bgr as (name, bgr, delta E), closest first."""
+        if not len(self):
+            return []
+        d = self.lab - bgr_to_lab([bgr])[0]
+        dist = np.einsum("ij,ij->i", d, d)
+        k = min(k, len(dist))
+        idx = np.argpartition(dist, k - 1)[:k]
+        idx = idx[np.argsort(dist[idx], kind="stable")]
+        return [(self.names[i], tuple(int(c) for c in self.bgr[i]), float(np.sqrt(dist[i])))
+                for i in idx]
+
+
+# ── Files ─────────────────────────────────────────────────────
+
+def parse_catalog(path):
+    """PaintCatalog from a .csv or .json file (no index cache)."""
+    default = os.path.splitext(os.path.basename(path))[0]
+    # Errors name the JSON record, or the CSV line (the header is line 1)
+    where, first = "paint", 1
+    if path.lower().endswith(".json"):
+        with open(path) as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            data = [{"category": cat, **r} for cat, records in data.items() for r in records]
+        records = data
+    else:
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            records = [{k.strip().lower(): v for k, v in r.items() if k} for r in csv.DictReader(f)]
+        where, first = "line", 2
+    names, cats, bgr = [], [], []
+    for i, r in enumerate(records):
+        try:
+            bgr.append(_record_bgr(r))
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"{path}: {where} {i + first}: no usable color ({e})") from None
+        names.append(str(r.get("name") or f"Paint {i + 1}"))
+        cats.append(str(r.get("category") or default))
+    return PaintCatalog(names, cats, np.array(bgr, np.uint8).reshape(-1, 3))
+
+
+def _source_stamp(path):
+    st = os.stat(path)
+    return np.array([st.st_size, st.st_mtime_ns], np.int64)
+
+
+def load_catalog(path):
+    """PaintCatalog for path, from its index cache when the file is unchanged."""
+    index = path + INDEX_EXT
+    stamp = _source_stamp(path)
+    try:
+        with np.load(index) as z:
+            if np.array_equal(z["stamp"], stamp):
+                return PaintCatalog(z["names"].tolist(), z["categories"].tolist(), z["bgr"], z["lab"])
+    except (OSError, KeyError, ValueError):
+        pass  # Missing, stale or unreadable: rebuild
+    catalog = parse_catalog(path)
+    try:
+        with open(index, "wb") as f:
+            np.savez(f, stamp=stamp, names=np.array(catalog.names, dtype=str),
+                     categories=np.array(catalog.categories, dtype=str),
+                     bgr=catalog.bgr, lab=catalog.lab)
+    except OSError:
+        pass  # Read-only location: just parse again next time
+    return catalog
@@ -0,0 +1,199 @@
+"""
+RoomPaint project files - saved wall selections.
+
+A project is a small JSON document (like the web app's project files)
+holding everything needed to skip straight to recoloring:
+
+  {
+    "version": 1,
+    "image": "bedroom image.jpeg",      # relative to the project file
+    "image_sha1": "...",                # to detect a replaced photo
+    "size": [w, h],                     # original photo size
+    "polygons": [[[x, y], ...], ...],   # original photo coordinates
+    "cuts": [{"after": n, "points": [[x, y], ...]}, ...],
+    "polygon_layers": [1, 1, 2, ...],   # layer label of each polygon
+    "layers": [{"id": 1, "name": "Sage Green", "bgr": [142, 188, 159]}, ...],
+    "mask": {"shape": [h, w], "rle": "..."},
+    "color": {"name": "Sage Green", "bgr": [142, 188, 159]}
+  }
+
+"color" is the active layer's color; projects without "layers" are a
+single layer 1 painted with it.
+
+Each cut clears its polygon from the first n polygons only (regions
+removed by a subtract click, or holes in an auto-filled region), so
+later polygons can paint over it again; see fill_selection().
+
+The mask is run-length encoded (alternating off/on run lengths, uint32,
+zlib-compressed, base64) and is only decoded when first accessed.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import zlib
+
+import cv2
+import numpy as np
+
+PROJECT_EXT = ".roompaint.json"
+PROJECT_VERSION = 1
+
+
+# ── Mask encoding ─────────────────────────────────────────────
+
+def rle_encode(mask):
+    """Binary mask -> base64 of zlib-compressed run lengths, starting with an 'off' run."""
+    flat = (np.asarray(mask) > 0).reshape(-1).view(np.uint8)
+    edges = np.flatnonzero(np.diff(flat)) + 1
+    bounds = np.concatenate(([0], edges, [flat.size]))
+    runs = np.diff(bounds).astype(np.uint32)
+    if flat.size and flat[0]:
+        runs = np.concatenate(([0], runs)).astype(np.uint32)
+    return base64.b64encode(zlib.compress(runs.tobytes(), 6)).decode("ascii")
+
+
+def rle_decode(data, shape):
+    runs = np.frombuffer(zlib.decompress(base64.b64decode(data)), dtype=np.uint32)
+    values = np.zeros(len(runs), dtype=np.uint8)
+    values[1::2] = 255
+    return np.repeat(values, runs).reshape(shape)
+
+
+def file_sha1(path, chunk=1 << 20):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def fill_selection(mask, polys, cuts=(), offset=(0, 0), values=None):
+    """Rasterize polygons into mask and apply (n, points) cuts in order.
+
+    Each polygon is filled with 255, or with values[i] (its layer label)
+    when given. Polygons are filled one at a time: a single fillPoly call
+    would XOR overlapping polygons.
+    """
+    def fill(start, stop):
+        for i in range(start, stop):
+            cv2.fillPoly(mask, [polys[i]], 255 if values is None else int(values[i]), offset=offset)
+
+    start = 0
+    for n, pts in cuts:
+        if n > start:
+            fill(start, n)
+            start = n
+        cv2.fillPoly(mask, [pts], 0, offset=offset)
+    fill(start, len(polys))
+    return mask
+
+
+# ── Project ───────────────────────────────────────────────────
+
+class Project:
+    """A loaded project; the mask is decoded lazily on first use."""
+
+    def __init__(self, path, data):
+        self.path = path
+        base = os.path.dirname(os.path.abspath(path))
+        self.image_path = os.path.join(base, data["image"])
+        self.image_sha1 = data.get("image_sha1")
+        self.size = tuple(data["size"])
+        self.polygons = data.get("polygons", [])
+        self.cuts = [(c["after"], c["points"]) for c in data.get("cuts", [])]
+        self.polygon_layers = data.get("polygon_layers") or [1] * len(self.polygons)
+        color = data.get("color") or {}
+        self.color_name = color.get("name")
+        self.color_bgr = tuple(color["bgr"]) if color.get("bgr") else None
+        if "layers" in data:
+            self.layer_colors = {l["id"]: (l.get("name"), tuple(l["bgr"])) for l in data["layers"]}
+        else:
+            self.layer_colors = {1: (self.color_name, self.color_bgr)} if self.color_bgr else {}
+        self._mask_data = data.get("mask")
+        self._mask = None
+
+    @property
+    def mask(self):
+        """Mask at the resolution it was saved, or None."""
+        if self._mask is None and self._mask_data:
+            self._mask = rle_decode(self._mask_data["rle"], tuple(self._mask_data["shape"]))
+        return self._mask
+
+    def mask_at(self, width, height):
+        """Mask scaled (nearest-neighbour) to width x height."""
+        mask = self.mask
+        if mask is None:
+            scale = width / self.size[0]
+            polys = [np.round(np.array(p, np.float64) * scale).astype(np.int32)
+                     for p in self.polygons]
+            cuts = [(n, np.round(np.array(p, np.float64) * scale).astype(np.int32))
+                    for n, p in self.cuts]
+            return fill_selection(np.zeros((height, width), np.uint8), polys, cuts)
+        if mask.shape != (height, width):
+            mask = cv2.resize(mask, (width, height), interpolation=cv2.INTER_NEAREST)
+        return mask
+
+    def labels_at(self, width, height):
+        """uint8 layer label map at width x height, trimmed to the saved mask."""
+        scale = width / self.size[0]
+        polys = [np.round(np.array(p, np.float64) * scale).astype(np.int32) for p in self.polygons]
+        cuts = [(n, np.round(np.array(p, np.float64) * scale).astype(np.int32))
+                for n, p in self.cuts]
+        labels = fill_selection(np.zeros((height, width), np.uint8), polys, cuts,
+                                values=self.polygon_layers)
+        if self.mask is not None:
+            mask = self.mask_at(width, height)
+            # Polygons traced from auto-filled regions are off by a pixel or
+            # two; give those mask pixels the neighbouring label
+            grown = cv2.dilate(labels, np.ones((5, 5), np.uint8))
+            labels = np.where(labels > 0, labels, grown)
+            labels[mask == 0] = 0
+        return labels
+
+    def image_matches(self):
+        return self.image_sha1 is None or (
+            os.path.exists(self.image_path) and file_sha1(self.image_path) == self.image_sha1)
+
+
+def project_path_for(image_path):
+    return os.path.splitext(image_path)[0] + PROJECT_EXT
+
+
+def save_project(path, image_path, size, polygons, mask=None,
+                 color_name=None, color_bgr=None, cuts=(), polygon_layers=None,
+                 layer_colors=None):
+    """Write a project; polygons and cuts must already be in original photo coordinates.
+
+    layer_colors maps layer label -> (name, bgr) for the painted layers.
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    data = {
+        "version": PROJECT_VERSION,
+        "image": os.path.relpath(os.path.abspath(image_path), base),
+        "image_sha1": file_sha1(image_path),
+        "size": [int(size[0]), int(size[1])],
+        "polygons": [[[int(x), int(y)] for x, y in p] for p in polygons],
+        "cuts": [{"after": int(n), "points": [[int(x), int(y)] for x, y in p]} for n, p in cuts],
+        "polygon_layers": [int(l) for l in polygon_layers or [1] * len(polygons)],
+        "layers": [{"id": int(k), "name": name, "bgr": [int(c) for c in bgr]}
+                   for k, (name, bgr) in sorted((layer_colors or {}).items())],
+        "mask": None,
+        "color": None,
+    }
+    if mask is not None:
+        data["mask"] = {"shape": list(mask.shape[:2]), "rle": rle_encode(mask)}
+    if color_bgr is not None:
+        data["color"] = {"name": color_name, "bgr": [int(c) for c in color_bgr]}
+    with open(path, "w") as f:
+        json.dump(data, f, separators=(",", ":"))
+    return path
+
+
+def load_project(path):
+    with open(path) as f:
+        data = json.load(f)
+    if data.get("version", 0) > PROJECT_VERSION:
+        raise ValueError(f"{path}: project version {data['version']} is newer than supported")
+    return Project(path, data)
@@ -0,0 +1,614 @@
+"""
+RoomPaint core - recolor, overlay and mask functions without any GUI.
+
+Everything a headless caller needs (batch and video renders, the local
+service, benchmarks, worker processes) lives here; color_changer.py
+re-exports it and adds the OpenCV window, palette and Tk color picker.
+Importing this module pulls in only NumPy and OpenCV.
+"""
+
+import os
+
+import cv2
+import numpy as np
+
+from project_file import fill_selection
+
+# ── Config ────────────────────────────────────────────────────
+IMAGE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          "bedroom image.jpeg")
+
+CATEGORIES = {
+    "Bedroom": [
+        ("Light Blue", (230, 216, 173)),
+        ("Slate Blue", (205, 90, 106)),
+        ("Navy Blue", (128, 0, 0)),
+        ("Sage Green", (142, 188, 159)),
+        ("Silver", (192, 192, 192)),
+        ("Lavender", (230, 230, 250)),
+        ("Warm Gray", (169, 169, 169)),
+        ("Charcoal", (54, 54, 54)),
+        ("Crisp White", (255, 255, 255)),
+        ("Terracotta", (94, 114, 226)),
+        ("Rust", (67, 75, 183)),
+        ("Cream", (220, 245, 255))
+    ],
+    "Kitchen": [
+        ("White", (255, 255, 255)),
+        ("Warm Yellow", (153, 228, 255)),
+        ("Red Accent", (50, 50, 220)),
+        ("Orange Accent", (0, 165, 255))
+    ],
+    "Hall/Living": [
+        ("Warm Beige", (200, 228, 245)),
+        ("Greige", (180, 180, 170)),
+        ("Soft Terracotta", (120, 140, 210)),
+        ("Earthy Ochre", (80, 160, 204)),
+        ("Green", (80, 180, 80)),
+        ("Charcoal Acc", (60, 60, 60))
+    ],
+    "Bathroom": [
+        ("Crisp White", (250, 250, 250)),
+        ("Aqua", (255, 255, 0)),
+        ("Light Teal", (180, 180, 100)),
+        ("Charcoal", (70, 70, 70)),
+        ("Black Accent", (10, 10, 10))
+    ],
+    "Dining": [
+        ("Warm Red", (60, 60, 200)),
+        ("Aubergine", (80, 40, 70))
+    ],
+    "Office": [
+        ("Green", (100, 180, 100)),
+        ("Deep Blue", (150, 50, 10)),
+        ("Yellow Acc", (50, 220, 240))
+    ],
+    "Gaming": [
+        ("Neutral Gray", (150, 150, 150)),
+        ("Matte Black", (25, 25, 25)),
+        ("White", (245, 245, 245))
+    ]
+}
+
+CATEGORY_NAMES = list(CATEGORIES.keys())
+
+# ── Recolor ───────────────────────────────────────────────────
+
+def recolor_walls(original_bgr, mask, target_bgr):
+    hsv = cv2.cvtColor(original_bgr, cv2.COLOR_BGR2HSV).copy()
+    t = np.uint8([[list(target_bgr)]])
+    t_hsv = cv2.cvtColor(t, cv2.COLOR_BGR2HSV)[0][0]
+
+    wall = mask > 0
+    hsv[wall, 0] = t_hsv[0]
+    hsv[wall, 1] = t_hsv[1]
+
+    if t_hsv[1] < 20: 
+        v_blend = hsv[wall, 2].astype(np.float32) * 0.3 + t_hsv[2] * 0.7
+        hsv[wall, 2] = np.clip(v_blend, 0, 255).astype(np.uint8)
+
+    recolored = cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
+
+    alpha = cv2.GaussianBlur(mask, (7, 7), 0).astype(np.float32) / 255.0
+    alpha_3 = np.dstack([alpha, alpha, alpha])
+    result = (alpha_3 * recolored.astype(np.float32) +
+              (1 - alpha_3) * original_bgr.astype(np.float32)).astype(np.uint8)
+    return result
+
+
+FEATHER_KSIZE = 7    # Gaussian kernel used to feather the mask edge
+FEATHER_MODES = ("gaussian", "guided")
+FEATHER_TILE = 64    # The band around the mask edge is feathered in tiles of this size
+GUIDED_RADIUS = 4    # Window radius of the "guided" (edge-aware) feather
+GUIDED_EPS = 2e-3    # Its regularization; smaller follows the photo's edges more closely
+
+
+def feather_radius(feather="gaussian"):
+    """Distance from the mask edge within which a feather can change alpha."""
+    return 2 * GUIDED_RADIUS if feather == "guided" else FEATHER_KSIZE // 2
+
+
+def guided_filter(guide, src, radius=GUIDED_RADIUS, eps=GUIDED_EPS):
+    """Edge-preserving smoothing of a uint8 src, steered by a guide image (He et al.).
+
+    Box filters only, on the guide's gray levels. Where the photo has an
+    edge near the mask edge, alpha snaps to it instead of spreading across.
+    """
+    if guide.ndim == 3:
+        guide = cv2.cvtColor(guide, cv2.COLOR_BGR2GRAY)
+    I = guide.astype(np.float32) / 255
+    p = src.astype(np.float32) / 255
+    k = (2 * radius + 1, 2 * radius + 1)
+    mean_I, mean_p = cv2.boxFilter(I, -1, k), cv2.boxFilter(p, -1, k)
+    var_I = cv2.boxFilter(I * I, -1, k) - mean_I * mean_I
+    a = (cv2.boxFilter(I * p, -1, k) - mean_I * mean_p) / (var_I + eps)
+    b = mean_p - a * mean_I
+    q = cv2.boxFilter(a, -1, k) * I + cv2.boxFilter(b, -1, k)
+    return np.clip(q * 255 + 0.5, 0, 255).astype(np.uint8)
+
+
+def feather_alpha(guide, mask, feather="gaussian"):
+    """Feathered alpha of mask, steered by guide (the photo, BGR or gray) if "guided".
+
+    "gaussian" blurs the mask: on uint8 that is cheaper than finding the
+    band. "guided" equals mask except in a thin band around the edge of
+    its non-zero area (pixels within feather_radius() of a change).
+    Only FEATHER_TILE tiles near a contour point are filtered, so its
+    cost follows the edge length rather than the area.
+    """
+    if feather not in FEATHER_MODES:
+        raise ValueError(f"unknown feather '{feather}' (choose from {', '.join(FEATHER_MODES)})")
+    if feather == "gaussian":
+        return cv2.GaussianBlur(mask, (FEATHER_KSIZE, FEATHER_KSIZE), 0)
+    alpha = mask.copy()
+    contours = cv2.findContours(mask, cv2.RETR_LIST, cv2.CHAIN_APPROX_NONE)[0]
+    if not contours:
+        return alpha
+    h, w = mask.shape[:2]
+    r, t = feather_radius(feather), FEATHER_TILE
+    # Tiles within r (+1 for the outer side) of an edge pixel; the box
+    # around a point is smaller than a tile, so its corners find them all
+    pts = np.concatenate(contours).reshape(-1, 2)
+    hit = np.zeros((-(-h // t), -(-w // t)), bool)
+    for d in ((-r - 1, -r - 1), (-r - 1, r + 1), (r + 1, -r - 1), (r + 1, r + 1)):
+        x, y = (np.clip(pts + d, 0, (w - 1, h - 1)) // t).T
+        hit[y, x] = True
+    kernel = np.ones((2 * r + 1, 2 * r + 1), np.uint8)
+    for i, j in zip(*np.nonzero(hit)):
+        ty, tx = i * t, j * t
+        ty2, tx2 = min(h, ty + t), min(w, tx + t)
+        # Work on the tile plus a halo, so the kept values never see the crop border
+        hy1, hx1 = max(0, ty - r), max(0, tx - r)
+        hy2, hx2 = min(h, ty2 + r), min(w, tx2 + r)
+        crop = mask[hy1:hy2, hx1:hx2]
+        inner = (slice(ty - hy1, ty2 - hy1), slice(tx - hx1, tx2 - hx1))
+        band = cv2.morphologyEx(crop, cv2.MORPH_GRADIENT, kernel)[inner]
+        out = guided_filter(guide[hy1:hy2, hx1:hx2], crop)[inner]
+        cv2.copyTo(out, band, alpha[ty:ty2, tx:tx2])
+    return alpha
+
+
+RECOLOR_MODES = ("hsv", "lab")
+EXPORT_TILE = 1024  # Full-resolution export works on tiles of this size
+LAB_HEADROOM = 12    # 8-bit L kept free at both ends so whites and blacks keep their shading
+
+
+def lightness(bgr):
+    """CIELAB L of a uint8 BGR image, on OpenCV's 8-bit scale (0..255)."""
+    return cv2.extractChannel(cv2.cvtColor(bgr, cv2.COLOR_BGR2Lab), 0)
+
+
+def wall_lightness(image, labels, strip=EXPORT_TILE):
+    """{label: mean L of its pixels} for every non-zero label, in strips of rows.
+
+    The "lab" mode maps each wall's own mean to the paint's L; tiles and
+    zoom levels pass these in so they all map with the same table.
+    """
+    sums = np.zeros(256)
+    counts = np.zeros(256, np.int64)
+    for y in range(0, labels.shape[0], strip):
+        keys = labels[y:y + strip].reshape(-1)
+        sums += np.bincount(keys, lightness(image[y:y + strip]).reshape(-1), 256)
+        counts += np.bincount(keys, minlength=256)
+    return {int(k): sums[k] / counts[k] for k in np.flatnonzero(counts[1:]) + 1}
+
+
+def lab_lut(target_bgr, ref_l):
+    """(1, 256, 3) table: L of a wall pixel -> recolored BGR in the "lab" mode.
+
+    The wall's mean lightness ref_l maps to the paint's L and every other
+    L scales by the same ratio, so shadows and highlights keep their
+    relative depth; highlights that would pass white are compressed
+    below it instead of clipped. a and b are the paint's.
+    """
+    t = cv2.cvtColor(np.uint8([[list(target_bgr)]]), cv2.COLOR_BGR2Lab)[0][0]
+    t_l = np.clip(t[0], LAB_HEADROOM, 255 - LAB_HEADROOM)
+    ref_l = np.clip(ref_l, 1, 254)
+    row = np.empty((1, 256, 3), dtype=np.uint8)
+    top = min(255.0, t_l * 255.0 / ref_l)
+    row[0, :, 0] = np.round(np.interp(np.arange(256), (0, ref_l, 255), (0, t_l, top)))
+    row[0, :, 1] = t[1]
+    row[0, :, 2] = t[2]
+    return cv2.cvtColor(row, cv2.COLOR_Lab2BGR)
+
+
+class RecolorEngine:
+    """Cached recolor for one (image, mask) pair.
+
+    Everything that does not depend on the target color (HSV conversion,
+    feathered alpha, the mask's bounding box) is computed once here, so
+    each recolor() only touches the pixels inside the bounding box.
+    With the default "gaussian" feather, output matches recolor_walls()
+    within +-1 per channel; "guided" feathers along the photo's edges
+    (see feather_alpha()). mode "lab" keeps the wall's lightness and
+    takes the paint's a/b instead of the HSV hue/saturation swap (see
+    lab_lut()); both are one table lookup per pixel.
+    """
+
+    def __init__(self, original_bgr, mask, wall=None, feather="gaussian", guide=None,
+                 mode="hsv", lab_ref=None):
+        # wall: pixels that take the paint inside the feathered band
+        # (default: the mask itself; layers pass every painted label);
+        # guide: what the guided feather follows (default: the original);
+        # lab_ref: wall lightness the "lab" mode pivots on (default: the mask's mean L)
+        if mode not in RECOLOR_MODES:
+            raise ValueError(f"unknown recolor mode '{mode}' (choose from {', '.join(RECOLOR_MODES)})")
+        self.original = original_bgr
+        self.mode = mode
+        guide = original_bgr if guide is None else guide
+        img_h, img_w = mask.shape[:2]
+        pad = feather_radius(feather)
+
+        x, y, bw, bh = cv2.boundingRect(mask)
+        if bw == 0 or bh == 0:
+            self.bbox = None
+            return
+
+        # Region where the feathered alpha can be non-zero
+        x1, y1 = max(0, x - pad), max(0, y - pad)
+        x2, y2 = min(img_w, x + bw + pad), min(img_h, y + bh + pad)
+        self.bbox = (x1, y1, x2, y2)
+
+        # Feather a slightly larger crop so the kept values never see the crop border
+        bx1, by1 = max(0, x1 - pad), max(0, y1 - pad)
+        bx2, by2 = min(img_w, x2 + pad), min(img_h, y2 + pad)
+        feathered = feather_alpha(guide[by1:by2, bx1:bx2], mask[by1:by2, bx1:bx2], feather)
+        alpha = feathered[y1 - by1:y2 - by1, x1 - bx1:x2 - bx1]
+
+        self._orig = original_bgr[y1:y2, x1:x2]
+        # Wall pixels get a constant H and S, so their recolored BGR is a
+        # function of V = max(B, G, R) alone and can be looked up per channel.
+        # In the "lab" mode a and b are constant instead, and the key is L.
+        if mode == "lab":
+            self._v = lightness(self._orig)
+            if lab_ref is None:
+                lv = self._v[mask[y1:y2, x1:x2] > 0]
+                lab_ref = lv.sum(dtype=np.int64) / lv.size
+        else:
+            b, g, r = cv2.split(self._orig)
+            self._v = cv2.max(cv2.max(b, g), r)
+        self.lab_ref = lab_ref
+
+        # Alpha is exactly 255 or 0 almost everywhere: those pixels are plain
+        # copies, only the feathered band needs the fixed-point blend
+        # out = (rec * a + orig * (255 - a)) // 255.
+        self._inner = (alpha == 255).view(np.uint8)
+        band = np.flatnonzero((alpha > 0) & (alpha < 255))
+        self._band = band
+        self._band_v = self._v.reshape(-1)[band]
+        wall = mask if wall is None else wall
+        self._band_wall = (wall[y1:y2, x1:x2].reshape(-1)[band] > 0)[:, None]
+        band_orig = self._orig.reshape(-1, 3)[band]
+        # Non-wall band pixels keep their own hue; recolor_walls still sends
+        # them through the HSV round trip, so cache that once. Converting as
+        # a one-pixel-wide column keeps the result independent of the crop.
+        self._band_roundtrip = band_orig
+        if len(band) and mode == "hsv":
+            column = band_orig[:, None, :]
+            hsv = cv2.cvtColor(column, cv2.COLOR_BGR2HSV)
+            self._band_roundtrip = cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)[:, 0, :]
+        band_alpha = alpha.reshape(-1)[band].astype(np.uint16)[:, None]
+        self._band_alpha = band_alpha
+        self._band_base = band_orig.astype(np.uint16) * (255 - band_alpha)
+        # Image coordinates of the band, for compositing layers into a shared image
+        self._band_ys, self._band_xs = np.divmod(band, x2 - x1)
+        self._band_ys += y1
+        self._band_xs += x1
+        self._band_orig = band_orig.astype(np.int16)
+
+    def wall_lut(self, target_bgr):
+        """(1, 256, 3) table: V (L in the "lab" mode) of a wall pixel -> recolored BGR."""
+        if self.mode == "lab":
+            return lab_lut(target_bgr, self.lab_ref)
+        t = np.uint8([[list(target_bgr)]])
+        t_hsv = cv2.cvtColor(t, cv2.COLOR_BGR2HSV)[0][0]
+        v = np.arange(256, dtype=np.uint8)
+        if t_hsv[1] < 20:
+            v_blend = v.astype(np.float32) * 0.3 + t_hsv[2] * 0.7
+            v = np.clip(v_blend, 0, 255).astype(np.uint8)
+        row = np.empty((1, 256, 3), dtype=np.uint8)
+        row[0, :, 0] = t_hsv[0]
+        row[0, :, 1] = t_hsv[1]
+        row[0, :, 2] = v
+        return cv2.cvtColor(row, cv2.COLOR_HSV2BGR)
+
+    def recolor_region(self, target_bgr):
+        """Recolor only the bounding box; returns (bbox, uint8 crop) or (None, None)."""
+        if self.bbox is None:
+            return None, None
+        lut = self.wall_lut(target_bgr)
+
+        out = self._orig.copy()
+        rec = cv2.merge([cv2.LUT(self._v, lut[:, :, c].copy()) for c in range(3)])
+        cv2.copyTo(rec, self._inner, out)
+
+        band = np.where(self._band_wall, lut[0][self._band_v], self._band_roundtrip)
+        band = band.astype(np.uint16)
+        band *= self._band_alpha
+        band += self._band_base
+        band //= 255
+        out.reshape(-1, 3)[self._band] = band
+        return self.bbox, out
+
+    def recolor(self, target_bgr):
+        """Full-size recolored image, same contract as recolor_walls()."""
+        result = self.original.copy()
+        bbox, crop = self.recolor_region(target_bgr)
+        if bbox is not None:
+            x1, y1, x2, y2 = bbox
+            result[y1:y2, x1:x2] = crop
+        return result
+
+    @property
+    def nbytes(self):
+        """Bytes held by the cached arrays (views of the original not included)."""
+        return sum(a.nbytes for a in vars(self).values()
+                   if isinstance(a, np.ndarray) and not np.may_share_memory(a, self.original))
+
+    def composite(self, out, target_bgr, clip=None):
+        """Paint this mask into out (full size), only inside clip if given.
+
+        Inner pixels are copied; band pixels get (blend - original) added
+        instead, so masks cut from one label map sum to the same seamless
+        edge a single mask would have. On a copy of the original the result
+        equals recolor().
+        """
+        if self.bbox is None:
+            return out
+        x1, y1, x2, y2 = self.bbox
+        cx1, cy1, cx2, cy2 = clip if clip is not None else self.bbox
+        ix1, iy1, ix2, iy2 = max(x1, cx1), max(y1, cy1), min(x2, cx2), min(y2, cy2)
+        if ix1 >= ix2 or iy1 >= iy2:
+            return out
+        lut = self.wall_lut(target_bgr)
+
+        sub = (slice(iy1 - y1, iy2 - y1), slice(ix1 - x1, ix2 - x1))
+        rec = cv2.merge([cv2.LUT(self._v[sub], lut[:, :, c].copy()) for c in range(3)])
+        cv2.copyTo(rec, self._inner[sub], out[iy1:iy2, ix1:ix2])
+
+        sel = slice(None)
+        if (ix1, iy1, ix2, iy2) != self.bbox:
+            ys, xs = self._band_ys, self._band_xs
+            sel = (ys >= iy1) & (ys < iy2) & (xs >= ix1) & (xs < ix2)
+        ys, xs = self._band_ys[sel], self._band_xs[sel]
+        band = np.where(self._band_wall[sel], lut[0][self._band_v[sel]], self._band_roundtrip[sel])
+        band = band.astype(np.uint16)
+        band *= self._band_alpha[sel]
+        band += self._band_base[sel]
+        band //= 255
+        px = out[ys, xs].astype(np.int16)
+        px += band.astype(np.int16)
+        px -= self._band_orig[sel]
+        out[ys, xs] = np.clip(px, 0, 255)
+        return out
+
+
+class LayerCompositor:
+    """Recolors a uint8 label map in which every non-zero label is a layer.
+
+    Each layer gets its own RecolorEngine, which only covers that layer's
+    bounding box. update() recomposites just the boxes of layers whose
+    color changed, so repainting one wall of ten costs one wall.
+    """
+
+    def __init__(self, original_bgr, labels, feather="gaussian", guide=None, mode="hsv",
+                 lab_refs=None):
+        # lab_refs: {label: lightness} for the "lab" mode (see wall_lightness())
+        self.original = original_bgr
+        self.engines = {}
+        lab_refs = lab_refs or {}
+        for label in np.flatnonzero(np.bincount(labels.reshape(-1), minlength=256)[1:]) + 1:
+            label = int(label)
+            mask = cv2.compare(labels, label, cv2.CMP_EQ)
+            self.engines[label] = RecolorEngine(original_bgr, mask, labels, feather, guide,
+                                                mode, lab_refs.get(label))
+        self.out = None  # Composite kept by update(), allocated on first use
+        self.colors = {}
+
+    @property
+    def nbytes(self):
+        out = self.out.nbytes if self.out is not None else 0
+        return self.original.nbytes + out + sum(e.nbytes for e in self.engines.values())
+
+    def render(self, colors):
+        """Composite {label: bgr} into a fresh copy; safe to call from many threads."""
+        out = self.original.copy()
+        for label, bgr in colors.items():
+            if label in self.engines:
+                self.engines[label].composite(out, bgr)
+        return out
+
+    def update(self, colors):
+        """Apply {label: bgr} (other layers stay unpainted); returns the composite."""
+        colors = {k: tuple(c) for k, c in colors.items() if k in self.engines and c is not None}
+        if self.out is None:
+            self.out = self.original.copy()
+        changed = [k for k in set(colors) | set(self.colors) if colors.get(k) != self.colors.get(k)]
+        self.colors = colors
+        boxes = np.array([self.engines[k].bbox for k in changed if self.engines[k].bbox is not None])
+        if not len(boxes):
+            return self.out
+        # Several layers changed: one pass over the box around all of them
+        x1, y1 = boxes[:, :2].min(axis=0)
+        x2, y2 = boxes[:, 2:].max(axis=0)
+        clip = (int(x1), int(y1), int(x2), int(y2))
+        self.out[y1:y2, x1:x2] = self.original[y1:y2, x1:x2]
+        for label, bgr in self.colors.items():
+            self.engines[label].composite(self.out, bgr, clip)
+        return self.out
+
+
+def scale_polys(polys, factor):
+    """Scale polygon point lists by factor into int32 arrays for cv2.fillPoly."""
+    return [np.round(np.array(p, np.float64) * factor).astype(np.int32) for p in polys]
+
+
+def recolor_tiled(image, polys, colors, tile=EXPORT_TILE, cuts=(), layers=None,
+                  feather="gaussian", mode="hsv", lab_refs=None):
+    """Recolor image in place, tile by tile, from polygons in its own coordinates.
+
+    colors is one BGR color, or {layer label: BGR} with layers giving each
+    polygon's label. The polygons are rasterized once into a uint8 label
+    map covering their bounding box, minus any (n, points) cuts; each tile
+    is then composited with a halo wide enough for the feather.
+    The result is byte-identical for any tile size and only tile-sized
+    intermediates are allocated. The "lab" mode takes each layer's
+    lightness from lab_refs, or measures it over the whole photo first.
+    """
+    img_h, img_w = image.shape[:2]
+    if not polys:
+        return image
+    if layers is None:
+        colors, layers = {1: colors}, [1] * len(polys)
+    halo = feather_radius(feather)
+    # Tiles are written back in place; the guided feather must see the untouched photo
+    guide = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if feather == "guided" else None
+    pts = np.concatenate(polys)
+    # Rasterize the whole bounding box so fillPoly never clips a polygon
+    mx1, my1 = pts.min(axis=0) - halo
+    mx2, my2 = pts.max(axis=0) + halo + 1
+    label_map = np.zeros((my2 - my1, mx2 - mx1), dtype=np.uint8)
+    fill_selection(label_map, polys, cuts, offset=(-int(mx1), -int(my1)), values=layers)
+
+    px1, py1 = max(0, mx1), max(0, my1)
+    px2, py2 = min(img_w, mx2), min(img_h, my2)
+    if mode == "lab" and lab_refs is None:
+        lab_refs = wall_lightness(image[py1:py2, px1:px2],
+                                  label_map[py1 - my1:py2 - my1, px1 - mx1:px2 - mx1], tile)
+    for ty in range(0, img_h, tile):
+        for tx in range(0, img_w, tile):
+            tx2, ty2 = min(tx + tile, img_w), min(ty + tile, img_h)
+            if tx2 <= px1 or tx >= px2 or ty2 <= py1 or ty >= py2:
+                continue
+            hx1, hy1 = max(0, tx - halo), max(0, ty - halo)
+            hx2, hy2 = min(img_w, tx2 + halo), min(img_h, ty2 + halo)
+
+            labels = np.zeros((hy2 - hy1, hx2 - hx1), dtype=np.uint8)
+            sx1, sy1 = max(hx1, px1), max(hy1, py1)
+            sx2, sy2 = min(hx2, px2), min(hy2, py2)
+            if sx1 < sx2 and sy1 < sy2:
+                labels[sy1 - hy1:sy2 - hy1, sx1 - hx1:sx2 - hx1] = \
+                    label_map[sy1 - my1:sy2 - my1, sx1 - mx1:sx2 - mx1]
+            if not labels.any():
+                continue
+            tile_guide = guide[hy1:hy2, hx1:hx2] if guide is not None else None
+            out = LayerCompositor(image[hy1:hy2, hx1:hx2], labels, feather, tile_guide,
+                                  mode, lab_refs).update(colors)
+            # Keep only the part of the composited halo tile inside this tile
+            image[ty:ty2, tx:tx2] = out[ty - hy1:ty2 - hy1, tx - hx1:tx2 - hx1]
+    return image
+
+
+def export_full_resolution(image_path, polys, scale_factor, colors, out_path,
+                           tile=EXPORT_TILE, cuts=(), layers=None, feather="gaussian",
+                           mode="hsv", lab_refs=None):
+    """Recolor the original photo from working-resolution polygons and save it."""
+    image = cv2.imread(image_path)
+    if image is None:
+        return None
+    cut_polys = scale_polys([pts for _, pts in cuts], 1.0 / scale_factor)
+    recolor_tiled(image, scale_polys(polys, 1.0 / scale_factor), colors, tile,
+                  [(n, pts) for (n, _), pts in zip(cuts, cut_polys)], layers, feather,
+                  mode, lab_refs)
+    cv2.imwrite(out_path, image)
+    return out_path
+
+
+# ── Assisted selection ────────────────────────────────────────
+
+SEED_COARSE_MAX = 320                # Flood fill runs on the pyramid level below this size
+SEED_TOLERANCE = 4                   # Neighbour-to-neighbour Lab step allowed by the fill
+SEED_LIMIT = np.uint8([40, 12, 12])  # Max L, a, b distance from the seed color
+
+
+class SeedSegmenter:
+    """One-click wall regions, solved coarse-to-fine on an image pyramid.
+
+    A click flood-fills the coarsest level (Lab color, stopped by Canny
+    edges and by colors too far from the seed). The region is then carried
+    down the pyramid one level at a time; at each level only the pixels on
+    its boundary are reclassified, by comparing them with the local mean
+    color inside and outside the coarse region. Per-click cost therefore
+    grows with the boundary length, not the image area.
+    """
+
+    def __init__(self, image):
+        self.shape = image.shape[:2]
+        levels = [cv2.GaussianBlur(image, (5, 5), 0)]
+        while max(levels[-1].shape[:2]) > SEED_COARSE_MAX:
+            levels.append(cv2.pyrDown(levels[-1]))
+        self.pyramid = [cv2.cvtColor(level, cv2.COLOR_BGR2LAB) for level in levels]
+        edges = cv2.Canny(cv2.cvtColor(levels[-1], cv2.COLOR_BGR2GRAY), 30, 90)
+        self.edges = cv2.dilate(edges, np.ones((2, 2), np.uint8)) > 0
+
+    def region(self, x, y, tolerance=SEED_TOLERANCE):
+        """uint8 mask (0/255) of the region grown from image point (x, y)."""
+        coarse = self.pyramid[-1]
+        h, w = self.shape
+        ch, cw = coarse.shape[:2]
+        sx, sy = min(cw - 1, int(x * cw / w)), min(ch - 1, int(y * ch / h))
+
+        # floodFill never enters non-zero mask pixels: use them as the barrier
+        ff = np.zeros((ch + 2, cw + 2), np.uint8)
+        far = (cv2.absdiff(coarse, coarse[sy, sx]) > SEED_LIMIT).any(axis=2)
+        ff[1:-1, 1:-1] = self.edges | far
+        ff[sy:sy + 3, sx:sx + 3] = 0  # A click right on an edge still grows
+        tol = (tolerance,) * 3
+        cv2.floodFill(coarse, ff, (sx, sy), 0, tol, tol,
+                      4 | cv2.FLOODFILL_MASK_ONLY | (2 << 8))
+        region = (ff[1:-1, 1:-1] == 2).astype(np.uint8)
+        region = cv2.morphologyEx(region, cv2.MORPH_CLOSE, np.ones((3, 3), np.uint8))
+        return self._refine(region) * np.uint8(255)
+
+    def _refine(self, region, window=(7, 7)):
+        ch, cw = region.shape
+        lab = self.pyramid[-1].astype(np.float32)
+        inside = region.astype(np.float32)
+        # Local mean colors on each side of the coarse boundary
+        means = []
+        for weight in (inside, 1 - inside):
+            total = cv2.boxFilter(weight, -1, window, normalize=False)
+            mean = cv2.boxFilter(lab * weight[..., None], -1, window, normalize=False)
+            mean /= np.maximum(total, 1e-3)[..., None]
+            mean[total == 0] = 1e4  # No samples on this side: never the closer one
+            means.append(mean)
+        m_in, m_out = means
+
+        mask = region
+        kernel = np.ones((3, 3), np.uint8)
+        for level in self.pyramid[-2::-1]:
+            h, w = level.shape[:2]
+            mask = cv2.resize(mask, (w, h), interpolation=cv2.INTER_NEAREST)
+            band = cv2.dilate(mask, kernel) - cv2.erode(mask, kernel)
+            pts = cv2.findNonZero(band)
+            if pts is None:
+                continue
+            xs, ys = pts.reshape(-1, 2).T
+            cx, cy = xs * cw // w, ys * ch // h
+            px = level[ys, xs].astype(np.float32)
+            d_in = ((px - m_in[cy, cx]) ** 2).sum(axis=1)
+            d_out = ((px - m_out[cy, cx]) ** 2).sum(axis=1)
+            mask[ys, xs] = d_in < d_out
+        return mask
+
+
+def mask_to_polys(mask, epsilon=1.0):
+    """Outer boundaries and holes of a binary mask as lists of (x, y) points."""
+    contours, hierarchy = cv2.findContours(mask, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
+    outer, holes = [], []
+    if hierarchy is None:
+        return outer, holes
+    for contour, (_, _, _, parent) in zip(contours, hierarchy[0]):
+        contour = cv2.approxPolyDP(contour, epsilon, True)
+        if len(contour) < 3:
+            continue
+        pts = [(int(x), int(y)) for x, y in contour.reshape(-1, 2)]
+        (holes if parent >= 0 else outer).append(pts)
+    return outer, holes
+
+
+def overlay_mask(image, mask, color=(0, 255, 0), opacity=0.35):
+    out = image.copy()
+    m = mask > 0
+    out[m] = ((1 - opacity) * out[m] + opacity * np.array(color)).astype(np.uint8)
+    return out
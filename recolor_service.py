@@ -0,0 +1,462 @@
+"""
+Recolor Service - the desktop recolor pipeline over local HTTP.
+
+  python recolor_service.py                      # http://127.0.0.1:8765
+  python recolor_service.py --port 9000 --cache-mb 1024 -j 8
+  python recolor_service.py --loadtest           # in-process server + load test
+  python recolor_service.py --loadtest --url http://127.0.0.1:8765 --sessions 48
+
+Clients (the web app, phones) upload a photo and its walls once and then
+only ask for colors, so every request after the first reuses the cached
+HSV/alpha intermediates of the session's RecolorEngines:
+
+  POST   /sessions                 {"image": "<base64 or data: URL>",
+                                    "polygons": [[[x, y], ...], ...],
+                                    "polygon_layers": [1, 2, ...],      # optional
+                                    "cuts": [{"after": n, "points": ...}]}  # optional
+         -> 201 {"id": "...", "width": w, "height": h, "layers": [1, 2]}
+  GET    /sessions/<id>/recolor?color=8EBC9F            (every layer)
+  GET    /sessions/<id>/recolor?colors=1:8EBC9F,2:ADD8E6
+         &format=jpeg|webp  &quality=90  &width=800     -> image bytes
+  DELETE /sessions/<id>
+  GET    /stats
+
+Polygons are in the uploaded image's pixel coordinates, as in project
+files. Sessions live in an LRU bounded by the bytes their engines hold;
+an evicted session answers 404 and the client uploads again. Decoding,
+recoloring and encoding run on a thread pool (OpenCV releases the GIL);
+the event loop only parses HTTP. Every response carries CORS headers so
+index.html can call it from a file:// or dev-server origin.
+"""
+
+import argparse
+import asyncio
+import base64
+import binascii
+import json
+import os
+import random
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import cv2
+import numpy as np
+
+from project_file import fill_selection
+from recolor_core import CATEGORIES, IMAGE_PATH, LayerCompositor
+
+HOST = "127.0.0.1"
+PORT = 8765
+CACHE_MB = 512            # Session cache budget
+MAX_BODY = 64 * 2**20     # Largest accepted upload
+LATENCY_WINDOW = 4096     # Samples kept for /stats percentiles
+INT32_MIN, INT32_MAX = -2**31, 2**31 - 1  # Coordinate range OpenCV accepts
+FORMATS = {"jpeg": (".jpg", cv2.IMWRITE_JPEG_QUALITY, "image/jpeg"),
+           "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY, "image/webp")}
+CORS = (("Access-Control-Allow-Origin", "*"),
+        ("Access-Control-Allow-Methods", "GET, POST, DELETE, OPTIONS"),
+        ("Access-Control-Allow-Headers", "Content-Type"))
+REASONS = {200: "OK", 201: "Created", 204: "No Content", 400: "Bad Request",
+           404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+           500: "Internal Server Error"}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# ── Helpers ───────────────────────────────────────────────────
+
+def parse_hex(text):
+    """'RRGGBB' or '#RRGGBB' (the web app's colors) -> BGR tuple."""
+    text = text.lstrip("#")
+    try:
+        if len(text) != 6:
+            raise ValueError
+        r, g, b = (int(text[i:i + 2], 16) for i in (0, 2, 4))
+    except ValueError:
+        raise HTTPError(400, f"bad color '{text}'") from None
+    return (b, g, r)
+
+
+def parse_colors(query, layers):
+    """{label: bgr} from ?color=RRGGBB (all layers) or ?colors=1:RRGGBB,2:..."""
+    if "colors" in query:
+        colors = {}
+        for item in query["colors"][0].split(","):
+            label, _, hex_color = item.partition(":")
+            if not label.isdigit():
+                raise HTTPError(400, f"bad layer color '{item}'")
+            colors[int(label)] = parse_hex(hex_color)
+        return colors
+    if "color" in query:
+        bgr = parse_hex(query["color"][0])
+        return {label: bgr for label in layers}
+    raise HTTPError(400, "need ?color= or ?colors=")
+
+
+def decode_image(data):
+    if data.startswith("data:"):
+        data = data.partition(",")[2]  # data:image/jpeg;base64,....
+    try:
+        raw = base64.b64decode(data, validate=True)
+    except (binascii.Error, ValueError):
+        raise HTTPError(400, "image is not valid base64") from None
+    image = cv2.imdecode(np.frombuffer(raw, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise HTTPError(400, "could not decode image")
+    return image
+
+
+def is_int(value, lo, hi):
+    return type(value) is int and lo <= value <= hi  # bool is not an int here
+
+
+def parse_points(points, what):
+    """[[x, y], ...] with at least 3 int32 points -> (N, 2) int32 array."""
+    if not (isinstance(points, list) and len(points) >= 3 and all(
+            isinstance(p, list) and len(p) == 2 and all(is_int(v, INT32_MIN, INT32_MAX) for v in p)
+            for p in points)):
+        raise HTTPError(400, f"{what} must be a list of at least 3 [x, y] integer points")
+    return np.array(points, np.int32)
+
+
+def build_session(payload):
+    """Decode an upload and build its compositor (runs on the executor).
+
+    Everything is validated before OpenCV sees it, so bad input is a 400.
+    """
+    if not isinstance(payload, dict):
+        raise HTTPError(400, "body must be a JSON object")
+    image = payload.get("image") or ""
+    if not isinstance(image, str):
+        raise HTTPError(400, "image must be a base64 string")
+    image = decode_image(image)
+    h, w = image.shape[:2]
+    polygons = payload.get("polygons") or []
+    cuts = payload.get("cuts") or []
+    if not isinstance(polygons, list) or not polygons:
+        raise HTTPError(400, "need polygons")
+    if not isinstance(cuts, list):
+        raise HTTPError(400, "cuts must be a list")
+    polys = [parse_points(p, f"polygon {i + 1}") for i, p in enumerate(polygons)]
+    layers = payload.get("polygon_layers") or [1] * len(polys)
+    if (not isinstance(layers, list) or len(layers) != len(polys)
+            or not all(is_int(l, 1, 255) for l in layers)):
+        raise HTTPError(400, "need one integer layer label 1-255 per polygon")
+    parsed = []
+    for i, c in enumerate(cuts):
+        if not isinstance(c, dict) or not is_int(c.get("after"), 0, len(polys)):
+            raise HTTPError(400, f"each cut needs 'after' as an integer 0-{len(polys)}")
+        parsed.append((c["after"], parse_points(c.get("points"), f"cut {i + 1}")))
+    cuts = parsed
+    labels = fill_selection(np.zeros((h, w), np.uint8), polys, cuts, values=layers)
+    return LayerCompositor(image, labels)
+
+
+def render(session, colors, fmt, quality, width):
+    """Recolor and encode one response (runs on the executor)."""
+    image = session.render(colors)
+    if width and width < image.shape[1]:
+        height = max(1, round(image.shape[0] * width / image.shape[1]))
+        image = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+    ext, flag, _ = FORMATS[fmt]
+    ok, buf = cv2.imencode(ext, image, [flag, quality])
+    if not ok:
+        raise HTTPError(500, f"could not encode {fmt}")
+    return buf.tobytes()
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+# ── Session cache ─────────────────────────────────────────────
+
+class SessionCache:
+    """LRU of LayerCompositors bounded by the bytes they hold.
+
+    Only touched from the event loop, so it needs no lock. The newest
+    session is always kept, even if it alone is over budget.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._items = OrderedDict()
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def add(self, sid, session):
+        self._items[sid] = session
+        self.nbytes += session.nbytes
+        while self.nbytes > self.max_bytes and len(self._items) > 1:
+            _, old = self._items.popitem(last=False)
+            self.nbytes -= old.nbytes
+            self.evictions += 1
+
+    def get(self, sid):
+        session = self._items.get(sid)
+        if session is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._items.move_to_end(sid)
+        return session
+
+    def remove(self, sid):
+        session = self._items.pop(sid, None)
+        if session is not None:
+            self.nbytes -= session.nbytes
+        return session is not None
+
+
+# ── Server ────────────────────────────────────────────────────
+
+class RecolorService:
+    def __init__(self, cache_mb=CACHE_MB, workers=None):
+        self.cache = SessionCache(cache_mb * 2**20)
+        self.pool = ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1)
+        self.started = time.time()
+        self.requests = 0
+        self.latency_ms = deque(maxlen=LATENCY_WINDOW)
+
+    async def serve(self, host=HOST, port=PORT):
+        return await asyncio.start_server(self.handle, host, port, limit=2**16)
+
+    async def handle(self, reader, writer):
+        """One keep-alive connection: parse, route and answer until closed."""
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    return
+                t0 = time.perf_counter()
+                lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, _ = lines[0].split(" ", 2)
+                except ValueError:
+                    return
+                headers = {}
+                for line in lines[1:]:
+                    name, _, value = line.partition(":")
+                    if name:
+                        headers[name.strip().lower()] = value.strip()
+
+                try:
+                    length = int(headers.get("content-length", 0))
+                    if length > MAX_BODY:
+                        raise HTTPError(413, "upload too large")
+                    body = await reader.readexactly(length) if length else b""
+                    status, payload, ctype = await self.route(method, target, body)
+                except HTTPError as e:
+                    status, payload, ctype = e.status, json.dumps({"error": str(e)}).encode(), \
+                        "application/json"
+                except asyncio.IncompleteReadError:
+                    return
+                except Exception as e:  # Keep serving other requests
+                    status, payload, ctype = 500, json.dumps({"error": repr(e)}).encode(), \
+                        "application/json"
+
+                keep_alive = headers.get("connection", "").lower() != "close"
+                writer.write(self._response(status, payload, ctype, keep_alive))
+                await writer.drain()
+                self.requests += 1
+                self.latency_ms.append((time.perf_counter() - t0) * 1000)
+                if not keep_alive:
+                    return
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _response(status, payload, ctype, keep_alive):
+        head = [f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+                f"Content-Length: {len(payload)}",
+                f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        if payload:
+            head.append(f"Content-Type: {ctype}")
+        head += [f"{k}: {v}" for k, v in CORS]
+        return ("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + payload
+
+    async def route(self, method, target, body):
+        url = urlsplit(target)
+        parts = [p for p in url.path.split("/") if p]
+        query = parse_qs(url.query)
+        loop = asyncio.get_running_loop()
+
+        if method == "OPTIONS":  # CORS preflight
+            return 204, b"", None
+
+        if parts == ["sessions"] and method == "POST":
+            try:
+                payload = json.loads(body)
+            except ValueError:
+                raise HTTPError(400, "body is not JSON") from None
+            session = await loop.run_in_executor(self.pool, build_session, payload)
+            sid = uuid.uuid4().hex
+            self.cache.add(sid, session)
+            h, w = session.original.shape[:2]
+            info = {"id": sid, "width": w, "height": h, "layers": sorted(session.engines)}
+            return 201, json.dumps(info).encode(), "application/json"
+
+        if len(parts) >= 2 and parts[0] == "sessions":
+            session = self.cache.get(parts[1])
+            if session is None:
+                raise HTTPError(404, "unknown or evicted session, upload again")
+            if len(parts) == 2 and method == "DELETE":
+                self.cache.remove(parts[1])
+                return 204, b"", None
+            if parts[2:] == ["recolor"] and method == "GET":
+                colors = parse_colors(query, session.engines)
+                fmt = query.get("format", ["jpeg"])[0].lower()
+                if fmt not in FORMATS:
+                    raise HTTPError(400, f"format must be one of {', '.join(FORMATS)}")
+                try:
+                    quality = int(query.get("quality", [90])[0])
+                    width = int(query.get("width", [0])[0])
+                except ValueError:
+                    raise HTTPError(400, "quality and width must be integers") from None
+                if width < 0:
+                    raise HTTPError(400, "width must be 0 (original size) or more")
+                quality = min(max(quality, 1), 100)  # The range both encoders accept
+                data = await loop.run_in_executor(self.pool, render, session, colors, fmt,
+                                                  quality, width)
+                return 200, data, FORMATS[fmt][2]
+            raise HTTPError(405, f"{method} not allowed here")
+
+        if parts == ["stats"] and method == "GET":
+            return 200, json.dumps(self.stats()).encode(), "application/json"
+        raise HTTPError(404, f"no route for {method} {url.path}")
+
+    def stats(self):
+        ms = sorted(self.latency_ms)
+        return {
+            "uptime_s": round(time.time() - self.started, 1),
+            "requests": self.requests,
+            "sessions": len(self.cache),
+            "cache_mb": round(self.cache.nbytes / 2**20, 1),
+            "cache_limit_mb": round(self.cache.max_bytes / 2**20, 1),
+            "hits": self.cache.hits, "misses": self.cache.misses,
+            "evictions": self.cache.evictions,
+            "p50_ms": round(percentile(ms, 0.50), 2),
+            "p99_ms": round(percentile(ms, 0.99), 2),
+        }
+
+
+# ── Load test ─────────────────────────────────────────────────
+
+async def http_request(reader, writer, method, path, body=b"", ctype="application/json"):
+    """Minimal keep-alive client; returns (status, body)."""
+    head = f"{method} {path} HTTP/1.1\r\nHost: x\r\nContent-Length: {len(body)}\r\n"
+    if body:
+        head += f"Content-Type: {ctype}\r\n"
+    writer.write(head.encode() + b"\r\n" + body)
+    await writer.drain()
+    lines = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+    status = int(lines[0].split(" ", 2)[1])
+    length = 0
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    return status, await reader.readexactly(length) if length else b""
+
+
+async def load_test(host, port, image_path, sessions, requests, fmt):
+    """Upload `sessions` rooms, then request `requests` recolors from all of them at once."""
+    image = cv2.imread(image_path)
+    if image is None:
+        raise SystemExit(f"ERROR: Could not load '{image_path}'")
+    h, w = image.shape[:2]
+    ok, buf = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    # Two walls, as two layers
+    polygons = [[[w // 20, h // 6], [w // 2, h // 5], [w // 2, h * 4 // 5], [w // 20, h * 5 // 6]],
+                [[w // 2, h // 5], [w * 19 // 20, h // 6], [w * 19 // 20, h * 5 // 6],
+                 [w // 2, h * 4 // 5]]]
+    upload = json.dumps({"image": base64.b64encode(buf.tobytes()).decode(),
+                         "polygons": polygons, "polygon_layers": [1, 2]}).encode()
+    swatches = ["%02X%02X%02X" % bgr[::-1] for c in CATEGORIES.values() for _, bgr in c]
+    per_client = max(1, requests // sessions)
+    latencies = []
+
+    async def client(i):
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            status, body = await http_request(reader, writer, "POST", "/sessions", upload)
+            if status != 201:
+                raise RuntimeError(f"upload failed: {status} {body[:200]!r}")
+            sid = json.loads(body)["id"]
+            rng = random.Random(i)
+            for _ in range(per_client):
+                colors = f"1:{rng.choice(swatches)},2:{rng.choice(swatches)}"
+                t0 = time.perf_counter()
+                status, body = await http_request(
+                    reader, writer, "GET", f"/sessions/{sid}/recolor?colors={colors}&format={fmt}")
+                latencies.append((time.perf_counter() - t0) * 1000)
+                if status != 200:
+                    raise RuntimeError(f"recolor failed: {status} {body[:200]!r}")
+        finally:
+            writer.close()
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(sessions)))
+    secs = time.perf_counter() - t0
+    ms = sorted(latencies)
+    print(f"  {sessions} sessions ({w}x{h}), {len(ms)} recolors ({fmt}) in {secs:.2f}s")
+    print(f"  >> {len(ms) / secs:.1f} req/s, p50 {percentile(ms, 0.5):.1f} ms, "
+          f"p99 {percentile(ms, 0.99):.1f} ms, max {ms[-1]:.1f} ms")
+
+
+# ── Main ──────────────────────────────────────────────────────
+
+async def run(args):
+    if args.loadtest and args.url:
+        url = urlsplit(args.url)
+        await load_test(url.hostname, url.port or 80, args.image, args.sessions, args.requests,
+                        args.format)
+        return
+    service = RecolorService(args.cache_mb, args.workers)
+    server = await service.serve(args.host, 0 if args.loadtest else args.port)
+    host, port = server.sockets[0].getsockname()[:2]
+    async with server:
+        if args.loadtest:
+            await load_test(host, port, args.image, args.sessions, args.requests, args.format)
+            print(f"  >> Server: {json.dumps(service.stats())}")
+            return
+        print(f"  >> Serving on http://{host}:{port} "
+              f"(cache {args.cache_mb} MB, {service.pool._max_workers} workers)")
+        await server.serve_forever()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Serve wall recoloring over local HTTP.")
+    ap.add_argument("--host", default=HOST)
+    ap.add_argument("--port", type=int, default=PORT)
+    ap.add_argument("--cache-mb", type=int, default=CACHE_MB, help="session cache budget")
+    ap.add_argument("-j", "--workers", type=int, default=None, help="recolor threads")
+    ap.add_argument("--loadtest", action="store_true",
+                    help="run a load test (against --url, or an in-process server)")
+    ap.add_argument("--url", help="server to load test, e.g. http://127.0.0.1:8765")
+    ap.add_argument("--image", default=IMAGE_PATH, help="photo uploaded by the load test")
+    ap.add_argument("--sessions", type=int, default=32, help="concurrent load-test clients")
+    ap.add_argument("--requests", type=int, default=640, help="total load-test recolors")
+    ap.add_argument("--format", default="jpeg", choices=sorted(FORMATS))
+    args = ap.parse_args()
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
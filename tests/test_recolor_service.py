@@ -0,0 +1,87 @@
+"""Bad client input to the recolor service is a 400, never a 500."""
+
+import asyncio
+import base64
+import json
+import os
+import sys
+import unittest
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from recolor_service import HTTPError, RecolorService, build_session  # noqa: E402
+
+IMAGE = base64.b64encode(cv2.imencode(".png", np.zeros((40, 50, 3), np.uint8))[1]).decode()
+SQUARE = [[5, 5], [30, 5], [30, 30], [5, 30]]
+
+
+def payload(**fields):
+    return {"image": IMAGE, "polygons": [SQUARE], **fields}
+
+
+class BuildSessionTest(unittest.TestCase):
+    def assert_400(self, body):
+        with self.assertRaises(HTTPError) as cm:
+            build_session(body)
+        self.assertEqual(cm.exception.status, 400)
+
+    def test_valid_upload(self):
+        session = build_session(payload(cuts=[{"after": 1, "points": [[8, 8], [12, 8], [12, 12]]}]))
+        self.assertEqual(sorted(session.engines), [1])
+
+    def test_body_not_an_object(self):
+        self.assert_400([1, 2])
+
+    def test_image_not_a_string(self):
+        self.assert_400(payload(image=5))
+
+    def test_no_polygons(self):
+        self.assert_400(payload(polygons=[]))
+
+    def test_empty_polygon(self):
+        self.assert_400(payload(polygons=[[]]))
+
+    def test_polygon_with_two_points(self):
+        self.assert_400(payload(polygons=[[[0, 0], [5, 5]]]))
+
+    def test_non_integer_coordinates(self):
+        self.assert_400(payload(polygons=[[[0, 0], [5, "x"], [5, 0]]]))
+
+    def test_coordinates_outside_int32(self):
+        self.assert_400(payload(polygons=[[[0, 0], [2**40, 5], [5, 0]]]))
+
+    def test_string_layer_label(self):
+        self.assert_400(payload(polygon_layers=["1"]))
+
+    def test_layer_label_out_of_range(self):
+        self.assert_400(payload(polygon_layers=[256]))
+
+    def test_bad_cut_index(self):
+        for after in ("1", None, -1, 2, True):
+            self.assert_400(payload(cuts=[{"after": after, "points": SQUARE}]))
+
+    def test_bad_cut_points(self):
+        self.assert_400(payload(cuts=[{"after": 0, "points": [[0, 0]]}]))
+
+
+class RouteTest(unittest.TestCase):
+    def setUp(self):
+        self.service = RecolorService(cache_mb=16, workers=1)
+        self.addCleanup(self.service.pool.shutdown)
+
+    def route(self, method, target, body=b""):
+        return asyncio.run(self.service.route(method, target, body))
+
+    def test_negative_width(self):
+        sid = json.loads(self.route("POST", "/sessions", json.dumps(payload()).encode())[1])["id"]
+        self.assertEqual(self.route("GET", f"/sessions/{sid}/recolor?color=8EBC9F&width=10")[0], 200)
+        with self.assertRaises(HTTPError) as cm:
+            self.route("GET", f"/sessions/{sid}/recolor?color=8EBC9F&width=-5")
+        self.assertEqual(cm.exception.status, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
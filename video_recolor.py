@@ -0,0 +1,214 @@
+"""
+Video Recolor - paint the walls of a walkthrough video.
+
+  python video_recolor.py walk.mp4 out.mp4 --mask first_frame.png --color "Sage Green"
+  python video_recolor.py walk.mp4 out.mp4 --project room.roompaint.json --color "#8EBC9F"
+
+The mask traced on the first frame is carried through the video: sparse
+Lucas-Kanade flow between consecutive frames gives a homography, the
+homographies are chained, and the first-frame mask is warped by the
+chain (so nearest-neighbour resampling never compounds).
+
+Decode, propagate+recolor and encode run as three overlapping stages
+connected by bounded queues, so memory stays flat for any length.
+CPU only.
+"""
+
+import argparse
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from project_file import PROJECT_EXT, load_project
+from recolor_core import CATEGORIES, RecolorEngine
+
+QUEUE_SIZE = 8       # Frames buffered between stages
+TRACK_WIDTH = 640    # Flow is computed on frames scaled to this width
+MIN_TRACKS = 12      # Fewer surviving points -> keep the mask, measure from the last good frame
+
+
+# ── Helpers ───────────────────────────────────────────────────
+
+def parse_color(text):
+    """Swatch name from CATEGORIES, '#RRGGBB', or 'B,G,R' -> BGR tuple."""
+    for colors in CATEGORIES.values():
+        for name, bgr in colors:
+            if name.lower() == text.lower():
+                return bgr
+    try:
+        if text.startswith("#") and len(text) == 7:
+            r, g, b = (int(text[i:i + 2], 16) for i in (1, 3, 5))
+            return (b, g, r)
+        parts = text.split(",")
+        if len(parts) == 3:
+            bgr = tuple(int(p) for p in parts)
+            if all(0 <= c <= 255 for c in bgr):
+                return bgr
+    except ValueError:
+        pass
+    raise argparse.ArgumentTypeError(
+        f"unknown color '{text}' (use a swatch name, '#RRGGBB' or 'B,G,R' with values 0-255)")
+
+
+def threaded(gen, maxsize=QUEUE_SIZE):
+    """Run a generator in its own thread, yielding its items through a bounded queue."""
+    q = queue.Queue(maxsize=maxsize)
+    done = object()
+    errors = []
+
+    def pump():
+        try:
+            for item in gen:
+                q.put(item)
+        except Exception as e:  # Re-raised on the consumer side
+            errors.append(e)
+        finally:
+            q.put(done)
+
+    threading.Thread(target=pump, daemon=True).start()
+    while True:
+        item = q.get()
+        if item is done:
+            break
+        yield item
+    if errors:
+        raise errors[0]
+
+
+# ── Stages ────────────────────────────────────────────────────
+
+def decode(cap):
+    while True:
+        ok, frame = cap.read()
+        if not ok:
+            return
+        yield frame
+
+
+class MaskTracker:
+    """Carries the first-frame mask through the video with chained homographies."""
+
+    def __init__(self, first_frame, mask):
+        h, w = mask.shape[:2]
+        self.size = (w, h)
+        self.mask0 = mask
+        self.mask = mask
+        self.scale = min(1.0, TRACK_WIDTH / w)
+        # Homographies live in tracking resolution; S maps full -> tracking
+        self._S = np.diag([self.scale, self.scale, 1.0])
+        self._S_inv = np.linalg.inv(self._S)
+        self._H = np.eye(3)
+        self._prev = self._gray(first_frame)
+
+    def _gray(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if self.scale < 1.0:
+            gray = cv2.resize(gray, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        return gray
+
+    def update(self, frame):
+        gray = self._gray(frame)
+        step = self._step(self._prev, gray)
+        if step is not None:
+            # On failure _prev stays put, so the next step includes this frame's motion
+            self._prev = gray
+            self._H = step @ self._H
+            H_full = self._S_inv @ self._H @ self._S
+            self.mask = cv2.warpPerspective(self.mask0, H_full, self.size, flags=cv2.INTER_NEAREST)
+        return self.mask
+
+    def _step(self, prev, gray):
+        # Track features on and around the walls (context helps at edges)
+        small_mask = cv2.resize(self.mask, (prev.shape[1], prev.shape[0]),
+                                interpolation=cv2.INTER_NEAREST)
+        region = cv2.dilate(small_mask, np.ones((31, 31), np.uint8))
+        pts = cv2.goodFeaturesToTrack(prev, maxCorners=400, qualityLevel=0.01,
+                                      minDistance=7, mask=region)
+        if pts is None or len(pts) < MIN_TRACKS:
+            return None
+        nxt, status, _ = cv2.calcOpticalFlowPyrLK(prev, gray, pts, None,
+                                                  winSize=(21, 21), maxLevel=3)
+        good = status.ravel() == 1
+        if good.sum() < MIN_TRACKS:
+            return None
+        H, _ = cv2.findHomography(pts[good], nxt[good], cv2.RANSAC, 3.0)
+        return H
+
+
+def recolor_stream(frames, mask, target_bgr):
+    """Yield recolored frames; mask belongs to the first frame."""
+    tracker = None
+    for frame in frames:
+        if tracker is None:
+            tracker = MaskTracker(frame, mask)
+            current = mask
+        else:
+            current = tracker.update(frame)
+        yield RecolorEngine(frame, current).recolor(target_bgr)
+
+
+# ── Main ──────────────────────────────────────────────────────
+
+def recolor_video(src, dst, mask, target_bgr, max_frames=None, report_every=50):
+    """Recolor src into dst; returns (frames, seconds)."""
+    cap = cv2.VideoCapture(src)
+    if not cap.isOpened():
+        raise SystemExit(f"ERROR: Could not open '{src}'")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    if mask.shape != (h, w):
+        mask = cv2.resize(mask, (w, h), interpolation=cv2.INTER_NEAREST)
+
+    fourcc = cv2.VideoWriter_fourcc(*("MJPG" if dst.lower().endswith(".avi") else "mp4v"))
+    writer = cv2.VideoWriter(dst, fourcc, fps, (w, h))
+
+    frames = decode(cap)
+    if max_frames:
+        frames = (f for _, f in zip(range(max_frames), frames))
+
+    n = 0
+    t0 = time.perf_counter()
+    try:
+        # decode -> [queue] -> propagate + recolor -> [queue] -> encode (this thread)
+        for out in threaded(recolor_stream(threaded(frames), mask, target_bgr)):
+            writer.write(out)
+            n += 1
+            if report_every and n % report_every == 0:
+                print(f"  {n} frames, {n / (time.perf_counter() - t0):.1f} fps")
+    finally:
+        cap.release()
+        writer.release()
+    return n, time.perf_counter() - t0
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Recolor walls across a video.")
+    ap.add_argument("src", help="input video")
+    ap.add_argument("dst", help="output video (.mp4 or .avi)")
+    ap.add_argument("--mask", help="wall mask for the first frame")
+    ap.add_argument("--project", help=f"project file ({PROJECT_EXT}) traced on the first frame")
+    ap.add_argument("--color", required=True, type=parse_color,
+                    help="swatch name, '#RRGGBB' or 'B,G,R'")
+    ap.add_argument("--max-frames", type=int)
+    args = ap.parse_args()
+
+    if args.project:
+        project = load_project(args.project)
+        mask = project.mask_at(*project.size)
+    elif args.mask:
+        mask = cv2.imread(args.mask, cv2.IMREAD_GRAYSCALE)
+        if mask is None:
+            raise SystemExit(f"ERROR: Could not load '{args.mask}'")
+    else:
+        raise SystemExit("ERROR: Need --mask or --project")
+
+    frames, secs = recolor_video(args.src, args.dst, mask, args.color, args.max_frames)
+    print(f"  >> {frames} frames in {secs:.2f}s = {frames / max(secs, 1e-9):.1f} fps -> {args.dst}")
+
+
+if __name__ == "__main__":
+    main()